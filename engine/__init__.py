@@ -0,0 +1,71 @@
+# Headless Ultimate Tic-Tac-Toe engine: game rules, bitboard state and
+# search, with no UI dependencies. Submodules are imported on first use of
+# one of their names, so `import engine` itself costs next to nothing.
+import importlib
+
+_EXPORTS = {
+    'init_game': 'game',
+    'get_valid_moves': 'game',
+    'is_valid_move': 'game',
+    'make_move': 'game',
+    'unmake_move': 'game',
+    'check_small_board_win': 'game',
+    'check_large_board_win': 'game',
+    'is_small_board_full': 'game',
+    'BitState': 'bitboard',
+    'TimedBitState': 'bitboard',
+    'TranspositionTable': 'transposition',
+    'SEARCH_TT': 'search',
+    'SearchContext': 'search',
+    'SearchTimeout': 'search',
+    'SearchStats': 'search',
+    'MoveOrderer': 'search',
+    'HeuristicOrderer': 'search',
+    'evaluate_state': 'search',
+    'minimax': 'search',
+    'search_root': 'search',
+    'ai_move': 'search',
+    'Book': 'book',
+    'build_book': 'book',
+    'load_book': 'book',
+    'get_search_pool': 'parallel',
+    'shutdown_search_pool': 'parallel',
+    'score_batch': 'batch_eval',
+    'score_children': 'batch_eval',
+    'MctsTree': 'mcts',
+    'SEARCH_TREE': 'mcts',
+    'mcts_move': 'mcts',
+    'Ponderer': 'ponder',
+    'stop_pondering': 'ponder',
+    'AIService': 'service',
+    'ServiceBusy': 'service',
+    'encode_game': 'records',
+    'decode_game': 'records',
+    'append_game': 'records',
+    'read_games': 'records',
+    'replay': 'records',
+    'build_index': 'records',
+    'GameIndex': 'records',
+    'serialize_state': 'persist',
+    'deserialize_state': 'persist',
+    'GameStore': 'persist',
+    'FileStore': 'persist',
+    'SQLiteStore': 'persist',
+    'open_store': 'persist',
+    'canonical_key': 'symmetry',
+    'transform_move': 'symmetry',
+    'transform_state': 'symmetry',
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from .bitboard import BitState
+from .search import HeuristicOrderer, MoveOrderer, SearchContext, ai_move, load_batch_eval, search_root
+from .records import replay
+from .tables import O
+from .transposition import TranspositionTable
+
+# Search benchmark.
+# Runs ai_move over a fixed corpus of positions and reports, per search
+# configuration and position category: nodes per second, time to reach
+# each depth, p50/p95/p99 move latency, peak traced memory and how often
+# the alpha-beta search had to search a move or a whole depth again. Results are
+# JSON so two runs (say, two commits) can be compared with --compare.
+#
+#   python -m engine.bench --out before.json
+#   python -m engine.bench --out after.json
+#   python -m engine.bench --compare before.json after.json
+
+CATEGORIES = ('opening', 'forced', 'anywhere', 'endgame')
+OPENING_PLIES = 4
+ENDGAME_CELLS = 20
+
+# Each configuration is ai_move keyword arguments plus tt_mb (0 disables
+# the table) and orderer ('heuristic' or 'raw')
+CONFIGS = {
+    'd4': {'depth': 4},
+    'd5': {'depth': 5},
+    'd5-raw': {'depth': 5, 'orderer': 'raw'},
+    'd5-nott': {'depth': 5, 'tt_mb': 0},
+    'd5-batch': {'depth': 5, 'batch_eval': True},
+    'budget250': {'depth': 81, 'time_budget_ms': 250},
+    'mcts250': {'engine': 'mcts', 'time_budget_ms': 250},
+}
+DEFAULT_CONFIGS = ('d4', 'd5', 'budget250')
+ORDERERS = {'heuristic': HeuristicOrderer, 'raw': MoveOrderer}
+
+def classify(state, ply):
+    if ply <= OPENING_PLIES:
+        return 'opening'
+    if state.open_cells() <= ENDGAME_CELLS:
+        return 'endgame'
+    target = state.next_board
+    if target is not None and not state.decided() >> target & 1:
+        return 'forced'
+    return 'anywhere'
+
+# Positions are move lists from seeded random games. Moves are drawn from
+# the sorted legal moves, so the corpus depends only on the rules and the
+# seed, not on the engine's move order, and stays the same across commits.
+def build_corpus(per_category=8, seed=2024):
+    rng = random.Random(seed)
+    corpus = {category: [] for category in CATEGORIES}
+    while any(len(positions) < per_category for positions in corpus.values()):
+        state = BitState()
+        moves = []
+        taken = set()
+        while not state.game_over:
+            if state.side == O:
+                category = classify(state, len(moves))
+                if category not in taken and len(corpus[category]) < per_category:
+                    corpus[category].append(list(moves))
+                    taken.add(category)
+            move = rng.choice(sorted(state.moves()))
+            state.make(*move)
+            moves.append(move)
+    return corpus
+
+def corpus_digest(corpus):
+    return hashlib.sha1(json.dumps(corpus, sort_keys=True).encode()).hexdigest()
+
+# Nearest-rank percentile of an already sorted list
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+def make_tt(config):
+    tt_mb = config.get('tt_mb', 16)
+    return TranspositionTable(tt_mb) if tt_mb else None
+
+def search_kwargs(config):
+    kwargs = {key: value for key, value in config.items() if key not in ('tt_mb', 'orderer')}
+    kwargs['orderer'] = ORDERERS[config.get('orderer', 'heuristic')]()
+    return kwargs
+
+# SearchContext for a configuration, for code that searches a BitState directly
+def make_context(config, tt=None):
+    return SearchContext(tt, orderer=ORDERERS[config.get('orderer', 'heuristic')](),
+                         batch_eval=load_batch_eval() if config.get('batch_eval') else None)
+
+# Cumulative seconds to finish each depth of an iterative search
+def time_to_depth(moves, config):
+    state = BitState.from_dict(replay(moves), 'O')
+    ctx = make_context(config, make_tt(config))
+    times = []
+    start = time.perf_counter()
+    for depth in range(1, config['depth'] + 1):
+        search_root(state, depth, ctx)
+        times.append(time.perf_counter() - start)
+    return times
+
+def run_category(config, positions):
+    latencies = []
+    nodes = 0
+    researches = {'pvs_researches': 0, 'aspiration_researches': 0}
+    depths = []
+    for moves in positions:
+        state = replay(moves)
+        tt = make_tt(config)
+        kwargs = search_kwargs(config)
+        start = time.perf_counter()
+        _, stats = ai_move(state, tt=tt, book=None, return_stats=True, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        nodes += stats.nodes
+        for name in researches:
+            researches[name] += getattr(stats, name) or 0
+        depths.append(stats.depth)
+
+    result = {
+        'positions': len(positions),
+        'nodes': nodes,
+        'nodes_per_sec': nodes / sum(latencies) if latencies else 0.0,
+        'mean_depth': sum(depths) / len(depths) if depths else 0.0,
+        **researches,
+    }
+    latencies.sort()
+    for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+        result[f'{name}_ms'] = percentile(latencies, fraction) * 1000
+
+    if 'time_budget_ms' not in config:
+        per_depth = [time_to_depth(moves, config) for moves in positions]
+        result['time_to_depth_ms'] = {
+            str(depth + 1): sum(times[depth] for times in per_depth) / len(per_depth) * 1000
+            for depth in range(config['depth'])
+        } if per_depth else {}
+
+    # Memory is traced in a separate pass since tracing slows the search
+    tracemalloc.start()
+    for moves in positions:
+        ai_move(replay(moves), tt=make_tt(config), book=None, **search_kwargs(config))
+    result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return result
+
+def run_benchmark(config_names=DEFAULT_CONFIGS, per_category=8, seed=2024, label=None):
+    corpus = build_corpus(per_category, seed)
+    report = {
+        'label': label,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'corpus_digest': corpus_digest(corpus),
+        'configs': {},
+    }
+    for name in config_names:
+        config = CONFIGS[name]
+        report['configs'][name] = {
+            'config': config,
+            'categories': {category: run_category(config, corpus[category]) for category in CATEGORIES},
+        }
+    return report
+
+# Metrics where a higher value is worse, and the one where lower is worse
+HIGHER_IS_WORSE = ('p50_ms', 'p95_ms', 'p99_ms', 'peak_memory_kb', 'nodes')
+LOWER_IS_WORSE = ('nodes_per_sec',)
+
+# Relative changes beyond threshold, as (config, category, metric, old, new)
+def compare(old, new, threshold=0.10):
+    if old.get('corpus_digest') != new.get('corpus_digest'):
+        raise ValueError("reports were run on different corpora")
+    regressions = []
+    for name, new_config in new['configs'].items():
+        old_config = old['configs'].get(name)
+        if old_config is None:
+            continue
+        for category, new_result in new_config['categories'].items():
+            old_result = old_config['categories'][category]
+            for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+                before, after = old_result[metric], new_result[metric]
+                if not before:
+                    continue
+                change = (after - before) / before
+                if metric in LOWER_IS_WORSE:
+                    change = -change
+                if change > threshold:
+                    regressions.append((name, category, metric, before, after))
+    return regressions
+
+def print_report(report):
+    for name, config_report in report['configs'].items():
+        print(f"== {name} {config_report['config']}")
+        print(f"{'category':<10} {'nodes/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'depth':>6} {'peak KB':>9}")
+        for category, result in config_report['categories'].items():
+            print(f"{category:<10} {result['nodes_per_sec']:>10.0f} {result['p50_ms']:>9.1f} "
+                  f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['mean_depth']:>6.1f} "
+                  f"{result['peak_memory_kb']:>9.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Ultimate Tic-Tac-Toe search")
+    parser.add_argument('--configs', default=','.join(DEFAULT_CONFIGS),
+                        help=f"comma-separated names from: {', '.join(CONFIGS)}")
+    parser.add_argument('--positions', type=int, default=8, help="positions per category")
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--label', help="free-form tag stored in the report, e.g. a commit")
+    parser.add_argument('--out', help="write the JSON report here")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two reports instead of running")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            regressions = compare(json.load(old_file), json.load(new_file), args.threshold)
+        for name, category, metric, before, after in regressions:
+            print(f"{name:<10} {category:<10} {metric:<16} {before:>12.2f} -> {after:>12.2f}")
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        return 1 if regressions else 0
+
+    report = run_benchmark(args.configs.split(','), args.positions, args.seed, args.label)
+    print_report(report)
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import time
+
+from .tables import (
+    BOARD_MOVES, FULL_MASK, FULL_TABLE, O, PLAYERS, POPCOUNT, SMALL_EVAL, WIN_TABLE, X,
+    ZOBRIST_CELLS, ZOBRIST_NEXT, ZOBRIST_SIDE, macro_eval,
+)
+
+# Bitboard game state used by the search.
+# Each small board is a 9-bit mask per player (bit i = cell i), and the
+# macro board is a 9-bit mask of won boards per player plus one of drawn
+# boards. Moves are made and unmade in place, so the search never copies.
+class BitState:
+    __slots__ = ('cells', 'empty', 'macro', 'drawn', 'next_board', 'side', 'winner', 'key',
+                 'board_scores', 'score', 'macro_score', 'undo_stack')
+
+    def __init__(self):
+        self.cells = [[0] * 9, [0] * 9]
+        self.empty = [FULL_MASK] * 9
+        self.macro = [0, 0]
+        self.drawn = 0
+        self.next_board = None
+        self.side = X
+        self.winner = None
+        self.key = ZOBRIST_NEXT[9]
+        # Evaluation terms kept up to date by make/unmake
+        self.board_scores = [0] * 9
+        self.score = 0
+        self.macro_score = 0
+        self.undo_stack = []
+
+    # Build a bitboard from the dict state used by the UI
+    @classmethod
+    def from_dict(cls, state, player=None):
+        bits = cls()
+        for board_idx in range(9):
+            for cell_idx, value in enumerate(state['board'][board_idx]):
+                if value:
+                    bits.cells[PLAYERS.index(value)][board_idx] |= 1 << cell_idx
+                    bits.empty[board_idx] &= ~(1 << cell_idx)
+            status = state['small_board_status'][board_idx]
+            if status == 'D':
+                bits.drawn |= 1 << board_idx
+            elif status is not None:
+                bits.macro[PLAYERS.index(status)] |= 1 << board_idx
+        bits.next_board = state['next_board']
+        bits.side = PLAYERS.index(player or state['current_player'])
+        bits.winner = state['winner']
+        bits.key = bits.compute_key()
+        bits.compute_scores()
+        return bits
+
+    # Evaluation terms from scratch; make/unmake update them incrementally
+    def compute_scores(self):
+        decided = self.decided()
+        self.board_scores = [
+            0 if decided >> board_idx & 1
+            else SMALL_EVAL[self.cells[X][board_idx] << 9 | self.cells[O][board_idx]]
+            for board_idx in range(9)
+        ]
+        self.score = sum(self.board_scores)
+        self.macro_score = macro_eval(self.macro[X], self.macro[O], self.drawn)
+
+    # Zobrist key from scratch; make/unmake keep self.key in sync with it
+    def compute_key(self):
+        key = ZOBRIST_NEXT[9 if self.next_board is None else self.next_board]
+        if self.side == O:
+            key ^= ZOBRIST_SIDE
+        for side in (X, O):
+            for board_idx in range(9):
+                mask = self.cells[side][board_idx]
+                for cell_idx in range(9):
+                    if mask >> cell_idx & 1:
+                        key ^= ZOBRIST_CELLS[side][board_idx * 9 + cell_idx]
+        return key
+
+    # Dict view of the bitboard, in the same shape as init_game()
+    def to_dict(self):
+        board = [['' for _ in range(9)] for _ in range(9)]
+        status = [None] * 9
+        for board_idx in range(9):
+            for cell_idx in range(9):
+                if self.cells[X][board_idx] >> cell_idx & 1:
+                    board[board_idx][cell_idx] = 'X'
+                elif self.cells[O][board_idx] >> cell_idx & 1:
+                    board[board_idx][cell_idx] = 'O'
+            if self.macro[X] >> board_idx & 1:
+                status[board_idx] = 'X'
+            elif self.macro[O] >> board_idx & 1:
+                status[board_idx] = 'O'
+            elif self.drawn >> board_idx & 1:
+                status[board_idx] = 'D'
+        return {
+            'board': board,
+            'small_board_status': status,
+            'next_board': self.next_board,
+            'current_player': PLAYERS[self.side],
+            'game_over': self.winner is not None,
+            'winner': self.winner,
+        }
+
+    # Independent copy, e.g. to keep a position while the original moves on
+    def copy(self):
+        other = type(self)()
+        other.cells = [self.cells[X][:], self.cells[O][:]]
+        other.empty = self.empty[:]
+        other.macro = self.macro[:]
+        other.drawn = self.drawn
+        other.next_board = self.next_board
+        other.side = self.side
+        other.winner = self.winner
+        other.key = self.key
+        other.board_scores = self.board_scores[:]
+        other.score = self.score
+        other.macro_score = self.macro_score
+        other.undo_stack = self.undo_stack[:]
+        return other
+
+    @property
+    def game_over(self):
+        return self.winner is not None
+
+    def decided(self):
+        return self.macro[X] | self.macro[O] | self.drawn
+
+    # Forced-board moves are a cached tuple; "play anywhere" concatenates
+    # the cached tuples of every undecided board.
+    def moves(self):
+        decided = self.decided()
+        target = self.next_board
+        if target is not None and not decided >> target & 1:
+            return BOARD_MOVES[target][self.empty[target]]
+        moves = []
+        for board_idx in range(9):
+            if not decided >> board_idx & 1:
+                moves.extend(BOARD_MOVES[board_idx][self.empty[board_idx]])
+        return moves
+
+    def is_legal(self, board_idx, cell_idx):
+        decided = self.decided()
+        if decided >> board_idx & 1 or not self.empty[board_idx] >> cell_idx & 1:
+            return False
+        target = self.next_board
+        return target is None or target == board_idx or bool(decided >> target & 1)
+
+    # Play a move for the side to move, recording what unmake() needs
+    def make(self, board_idx, cell_idx):
+        side = self.side
+        prev_next = self.next_board
+        prev_board_score = self.board_scores[board_idx]
+        self.undo_stack.append((board_idx, cell_idx, prev_next, self.key, prev_board_score,
+                                self.macro_score))
+        mask = self.cells[side][board_idx] | (1 << cell_idx)
+        self.cells[side][board_idx] = mask
+        self.empty[board_idx] &= ~(1 << cell_idx)
+
+        board_decided = True
+        if WIN_TABLE[mask]:
+            self.macro[side] |= 1 << board_idx
+            if WIN_TABLE[self.macro[side]]:
+                self.winner = PLAYERS[side]
+        elif FULL_TABLE[FULL_MASK & ~self.empty[board_idx]]:
+            self.drawn |= 1 << board_idx
+        else:
+            board_decided = False
+
+        if board_decided:
+            board_score = 0
+            self.macro_score = macro_eval(self.macro[X], self.macro[O], self.drawn)
+        else:
+            board_score = SMALL_EVAL[self.cells[X][board_idx] << 9 | self.cells[O][board_idx]]
+        self.board_scores[board_idx] = board_score
+        self.score += board_score - prev_board_score
+
+        decided = self.decided()
+        if self.winner is None and FULL_TABLE[decided]:
+            self.winner = 'Draw'
+
+        self.next_board = None if decided >> cell_idx & 1 else cell_idx
+        self.side = side ^ 1
+        self.key ^= (ZOBRIST_CELLS[side][board_idx * 9 + cell_idx] ^ ZOBRIST_SIDE
+                     ^ ZOBRIST_NEXT[9 if prev_next is None else prev_next]
+                     ^ ZOBRIST_NEXT[9 if self.next_board is None else self.next_board])
+
+    # Take back the last move. Moves only go into undecided boards of
+    # unfinished games, so the board status and winner are simply cleared.
+    def unmake(self):
+        board_idx, cell_idx, prev_next, prev_key, prev_board_score, prev_macro_score = self.undo_stack.pop()
+        side = self.side ^ 1
+        bit = 1 << board_idx
+        self.cells[side][board_idx] &= ~(1 << cell_idx)
+        self.empty[board_idx] |= 1 << cell_idx
+        self.macro[side] &= ~bit
+        self.drawn &= ~bit
+        self.winner = None
+        self.next_board = prev_next
+        self.side = side
+        self.key = prev_key
+        self.score += prev_board_score - self.board_scores[board_idx]
+        self.board_scores[board_idx] = prev_board_score
+        self.macro_score = prev_macro_score
+
+    # Moves left in undecided boards; searching this deep is exact
+    def open_cells(self):
+        decided = self.decided()
+        return sum(POPCOUNT[self.empty[board_idx]]
+                   for board_idx in range(9) if not decided >> board_idx & 1)
+
+# BitState that adds up the time spent generating moves and making and
+# unmaking them, for profiling. Plain BitState pays nothing for this.
+class TimedBitState(BitState):
+    __slots__ = ('movegen_time', 'make_time')
+
+    def __init__(self):
+        super().__init__()
+        self.movegen_time = 0.0
+        self.make_time = 0.0
+
+    def moves(self):
+        started = time.perf_counter()
+        moves = super().moves()
+        self.movegen_time += time.perf_counter() - started
+        return moves
+
+    def make(self, board_idx, cell_idx):
+        started = time.perf_counter()
+        super().make(board_idx, cell_idx)
+        self.make_time += time.perf_counter() - started
+
+    def unmake(self):
+        started = time.perf_counter()
+        super().unmake()
+        self.make_time += time.perf_counter() - started
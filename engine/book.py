@@ -0,0 +1,141 @@
+import logging
+import mmap
+import os
+import random
+import struct
+
+from .bitboard import BitState
+from .symmetry import INVERSE, canonical_key, transform_move
+from .tables import O
+from .transposition import TranspositionTable
+
+# Opening book and solved-endgame file.
+# An open-addressing hash table on disk: a 16-byte header, then a
+# power-of-two number of 16-byte slots (Zobrist key, move as
+# board * 9 + cell, kind, score, depth). It is memory-mapped read-only and
+# a lookup is one hash probe plus a short linear scan. BOOK entries come
+# from deep searches of early positions; SOLVED entries are exact results
+# of positions with few empty cells left. Positions are stored once for
+# all their symmetric variants, under the canonical key and with the move
+# in the canonical orientation.
+BOOK_MAGIC = b'UTTB'
+BOOK_VERSION = 2
+BOOK_HEADER = struct.Struct('<4sHxxI4x')
+BOOK_SLOT = struct.Struct('<QBBhB3x')
+BOOK, SOLVED = 1, 2
+BOOK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uttt_book.bin')
+
+class Book:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as book_file:
+            self.data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, slots = BOOK_HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {BOOK_VERSION} book file")
+        self.mask = slots - 1
+
+    # (move, kind, score, depth) for the position, or None
+    def probe(self, key):
+        slot = key & self.mask
+        while True:
+            entry_key, move, kind, score, depth = BOOK_SLOT.unpack_from(
+                self.data, BOOK_HEADER.size + slot * BOOK_SLOT.size)
+            if kind == 0:
+                return None
+            if entry_key == key:
+                return divmod(move, 9), kind, score, depth
+            slot = (slot + 1) & self.mask
+
+    # probe() for a BitState in any orientation; the move is mapped back
+    # onto the state
+    def lookup(self, state):
+        key, sym = canonical_key(state)
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        move, kind, score, depth = entry
+        return transform_move(move, INVERSE[sym]), kind, score, depth
+
+    def close(self):
+        self.data.close()
+
+# entries maps Zobrist key -> ((board, cell), kind, score, depth)
+def write_book(path, entries):
+    slots = 16
+    while slots < 2 * len(entries):
+        slots *= 2
+    data = bytearray(BOOK_HEADER.size + slots * BOOK_SLOT.size)
+    BOOK_HEADER.pack_into(data, 0, BOOK_MAGIC, BOOK_VERSION, slots)
+    for key, ((board_idx, cell_idx), kind, score, depth) in entries.items():
+        slot = key & (slots - 1)
+        while data[BOOK_HEADER.size + slot * BOOK_SLOT.size + 9]:
+            slot = (slot + 1) & (slots - 1)
+        BOOK_SLOT.pack_into(data, BOOK_HEADER.size + slot * BOOK_SLOT.size,
+                            key, board_idx * 9 + cell_idx, kind, int(score), depth)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as book_file:
+        book_file.write(data)
+    os.replace(tmp_path, path)
+
+# None if there is no book, or only one from an older version
+def load_book(path=BOOK_PATH):
+    if not os.path.exists(path):
+        return None
+    try:
+        return Book(path)
+    except ValueError as exc:
+        logging.getLogger(__name__).warning("%s; rebuild it with build_book()", exc)
+        return None
+
+# Store an entry for `state` under its canonical key
+def add_entry(entries, state, move, kind, score, depth):
+    key, sym = canonical_key(state)
+    entries[key] = (transform_move(move, sym), kind, score, depth)
+
+# Offline builder. Every position with O to move within book_plies of the
+# start, up to symmetry, is searched to book_depth. Then endgame_games seeded random games
+# are played down to endgame_cells open cells, and each such position with
+# O to move is solved exactly.
+def build_book(path=BOOK_PATH, book_plies=3, book_depth=5, endgame_games=2000,
+               endgame_cells=12, seed=0):
+    from .search import HeuristicOrderer, SearchContext, search_root
+
+    entries = {}
+    frontier = [BitState()]
+    for ply in range(book_plies + 1):
+        next_frontier = {}
+        for state in frontier:
+            if state.side == O:
+                ctx = SearchContext(TranspositionTable(4), orderer=HeuristicOrderer())
+                move, score = search_root(state, book_depth, ctx)
+                add_entry(entries, state, move, BOOK, score, book_depth)
+            if ply < book_plies:
+                for move in state.moves():
+                    state.make(*move)
+                    key = canonical_key(state)[0]
+                    if not state.game_over and key not in next_frontier:
+                        child = BitState()
+                        for played in (entry[:2] for entry in state.undo_stack):
+                            child.make(*played)
+                        next_frontier[key] = child
+                    state.unmake()
+        frontier = list(next_frontier.values())
+
+    rng = random.Random(seed)
+    tt = TranspositionTable(64)
+    for _ in range(endgame_games):
+        state = BitState()
+        while not state.game_over:
+            cells = state.open_cells()
+            if cells <= endgame_cells and state.side == O and canonical_key(state)[0] not in entries:
+                ctx = SearchContext(tt, orderer=HeuristicOrderer())
+                move, score = search_root(state, cells, ctx)
+                add_entry(entries, state, move, SOLVED, score, cells)
+            state.make(*rng.choice(state.moves()))
+
+    write_book(path, entries)
+    return len(entries)
+
+SEARCH_BOOK = load_book()
@@ -0,0 +1,95 @@
+from .search import SearchContext, SearchTimeout
+from .tables import O, WIN_TABLE
+from .transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Exact endgame solver.
+# Once few cells are left in undecided boards the game can be searched to
+# the end. Values are game results from O's point of view: 1 for an O
+# win, -1 for an X win and 0 for a draw. The root asks null-window
+# questions ("does this move win?", then "does it at least draw?") and
+# each one is answered by an alpha-beta search over the three results.
+# Proven bounds are kept in a fixed-size transposition table that
+# outlives the search, so later moves of the same endgame are mostly
+# cache hits. With only three results, every bound is exact, a lower
+# bound or an upper bound, as in the search's table. All entries are
+# stored at depth 0, so a new result always takes its slot.
+
+ENDGAME_CELLS = 16
+SOLVE_CACHE_MB = 16
+
+SOLVE_CACHE = TranspositionTable(SOLVE_CACHE_MB)
+RESULTS = {'O': 1, 'X': -1, 'Draw': 0}
+
+# Moves that win their small board first
+def solver_order(state, moves):
+    cells = state.cells[state.side]
+    return sorted(moves, key=lambda move: WIN_TABLE[cells[move[0]] | (1 << move[1])], reverse=True)
+
+def solve(state, alpha, beta, ctx, cache):
+    ctx.visit(state)
+    if state.winner is not None:
+        return RESULTS[state.winner]
+
+    key = state.key
+    entry = cache.probe(key)
+    if entry is not None:
+        _, _, score, bound, _, _ = entry
+        if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+            return score
+        if bound == LOWER:
+            alpha = max(alpha, score)
+        else:
+            beta = min(beta, score)
+    alpha_orig, beta_orig = alpha, beta
+
+    maximizing = state.side == O
+    best = -1 if maximizing else 1
+    for move in solver_order(state, state.moves()):
+        state.make(*move)
+        value = solve(state, alpha, beta, ctx, cache)
+        state.unmake()
+        if maximizing:
+            if value > best:
+                best = value
+            alpha = max(alpha, value)
+        else:
+            if value < best:
+                best = value
+            beta = min(beta, value)
+        if alpha >= beta:
+            break
+
+    # A result outside the window only proves a bound
+    if best >= beta_orig:
+        bound = LOWER
+    elif best <= alpha_orig:
+        bound = UPPER
+    else:
+        bound = EXACT
+    cache.store(key, 0, best, bound, None)
+    return best
+
+# Best move and exact result for the side to move, or None if the
+# deadline passes first. Each root move is tested with null windows: a
+# win is taken at once, otherwise the first move that holds the draw.
+def solve_root(state, deadline=None, cache=SOLVE_CACHE):
+    ctx = SearchContext(deadline=deadline)
+    maximizing = state.side == O
+    win, loss = (1, -1) if maximizing else (-1, 1)
+    moves = solver_order(state, state.moves())
+    played = len(state.undo_stack)
+    try:
+        for target in (win, 0):
+            # Window just below (or above) the target result
+            alpha, beta = (target - 1, target) if maximizing else (target, target + 1)
+            for move in moves:
+                state.make(*move)
+                value = solve(state, alpha, beta, ctx, cache)
+                state.unmake()
+                if value >= beta if maximizing else value <= alpha:
+                    return move, target, ctx.nodes
+    except SearchTimeout:
+        while len(state.undo_stack) > played:
+            state.unmake()
+        return None
+    return moves[0], loss, ctx.nodes
@@ -0,0 +1,101 @@
+import time
+
+from .tables import FULL_MASK, FULL_TABLE, WIN_TABLE, cells_mask
+
+# Initialize game state
+def init_game():
+    return {
+        'board': [['' for _ in range(9)] for _ in range(9)],
+        'small_board_status': [None] * 9,
+        'empty_cells': [set(range(9)) for _ in range(9)],
+        'next_board': None,
+        'current_player': 'X',
+        'game_over': False,
+        'winner': None,
+        'move_history': [],
+        'start_time': time.time()
+    }
+
+# Check if a player won a small board
+def check_small_board_win(board, board_idx, player):
+    return WIN_TABLE[cells_mask(board[board_idx], player)]
+
+# Check if a small board is full
+def is_small_board_full(board, board_idx):
+    return FULL_TABLE[FULL_MASK & ~cells_mask(board[board_idx], '')]
+
+# Check if large board has a winner
+def check_large_board_win(status, player):
+    return WIN_TABLE[cells_mask(status, player)]
+
+# Get valid moves
+# Moves come from each board's empty-cell set, in board then cell order,
+# so the result is deterministic for the search.
+def get_valid_moves(state):
+    target = state['next_board']
+    status = state['small_board_status']
+    empty_cells = state['empty_cells']
+    
+    # 1. If there is a target board and it is not yet won or drawn
+    if target is not None and status[target] is None and empty_cells[target]:
+        return [(target, cell) for cell in sorted(empty_cells[target])]
+    
+    # 2. If no moves are possible in the target board (it's full/won) 
+    # OR no target is set, the player can move in ANY available board.
+    moves = []
+    for board_idx in range(9):
+        if status[board_idx] is None:
+            moves.extend((board_idx, cell_idx) for cell_idx in sorted(empty_cells[board_idx]))
+    return moves
+
+# Check a single move without building the move list
+def is_valid_move(state, board_idx, cell_idx):
+    if state['small_board_status'][board_idx] is not None:
+        return False
+    if cell_idx not in state['empty_cells'][board_idx]:
+        return False
+    target = state['next_board']
+    return target is None or target == board_idx or state['small_board_status'][target] is not None
+
+# Make a move
+# Returns an undo record for unmake_move: the move plus everything the
+# move can change besides the cell itself, so a caller can try a move on
+# the state and take it back without copying the dict.
+def make_move(state, board_idx, cell_idx, player):
+    undo = (board_idx, cell_idx, state['next_board'], state['small_board_status'][board_idx],
+            state['game_over'], state['winner'], state['current_player'])
+    state['board'][board_idx][cell_idx] = player
+    state['empty_cells'][board_idx].discard(cell_idx)
+    
+    if check_small_board_win(state['board'], board_idx, player):
+        state['small_board_status'][board_idx] = player
+    elif is_small_board_full(state['board'], board_idx):
+        state['small_board_status'][board_idx] = 'D'
+    
+    if check_large_board_win(state['small_board_status'], player):
+        state['game_over'] = True
+        state['winner'] = player
+    elif all(s is not None for s in state['small_board_status']):
+        state['game_over'] = True
+        state['winner'] = 'Draw'
+    
+    # FIX: Check if the target board (determined by cell_idx) is still available
+    if state['small_board_status'][cell_idx] is None:
+        state['next_board'] = cell_idx
+    else:
+        state['next_board'] = None
+    
+    state['current_player'] = 'O' if player == 'X' else 'X'
+    return undo
+
+# Take back a move using the record make_move returned. Records must be
+# undone in reverse order.
+def unmake_move(state, undo):
+    board_idx, cell_idx, prev_next, prev_status, prev_game_over, prev_winner, prev_player = undo
+    state['board'][board_idx][cell_idx] = ''
+    state['empty_cells'][board_idx].add(cell_idx)
+    state['small_board_status'][board_idx] = prev_status
+    state['game_over'] = prev_game_over
+    state['winner'] = prev_winner
+    state['next_board'] = prev_next
+    state['current_player'] = prev_player
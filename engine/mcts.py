@@ -0,0 +1,354 @@
+import json
+import logging
+import math
+import random
+import time
+
+from .bitboard import BitState
+from .book import SEARCH_BOOK
+from .search import SearchContext, SearchStats, logger, run_solver
+from .tables import BOARD_MOVES, FULL_MASK, PLAYERS, WIN_SCORE, WIN_TABLE, X, O
+
+# Monte Carlo tree search (UCT).
+# Leaves are scored by random playouts to the end of the game, played on
+# bare cell masks rather than a full BitState. Nodes live in a pool of
+# parallel lists indexed by node number, with the children of a node in
+# one contiguous block. The pool stops growing at its size cap, after
+# which the search keeps refining the tree it has. Between turns the tree
+# is kept: the moves played since the last search pick the new root, and
+# its subtree is compacted into a fresh pool.
+
+MCTS_SIZE_MB = 32
+MCTS_ITERATIONS = 4000
+EXPLORATION = 1.4
+DEADLINE_CHECK_ITERATIONS = 32
+
+# Result of a random game from `state`: the winning side, or None for a draw
+def playout(state, rng):
+    cells = [state.cells[X][:], state.cells[O][:]]
+    empty = state.empty[:]
+    macro = state.macro[:]
+    decided = state.decided()
+    side = state.side
+    target = state.next_board
+    choice = rng.choice
+    while True:
+        if target is not None and not decided >> target & 1:
+            board_idx, cell_idx = choice(BOARD_MOVES[target][empty[target]])
+        else:
+            moves = []
+            for open_idx in range(9):
+                if not decided >> open_idx & 1:
+                    moves.extend(BOARD_MOVES[open_idx][empty[open_idx]])
+            board_idx, cell_idx = choice(moves)
+
+        mask = cells[side][board_idx] | (1 << cell_idx)
+        cells[side][board_idx] = mask
+        empty[board_idx] &= ~(1 << cell_idx)
+        if WIN_TABLE[mask]:
+            macro[side] |= 1 << board_idx
+            decided |= 1 << board_idx
+            if WIN_TABLE[macro[side]]:
+                return side
+        elif not empty[board_idx]:
+            decided |= 1 << board_idx
+        if decided == FULL_MASK:
+            return None
+        target = cell_idx
+        side ^= 1
+
+class MctsTree:
+    # Rough size of one node across the pool lists and the numbers in them
+    NODE_BYTES = 120
+
+    def __init__(self, size_mb=MCTS_SIZE_MB, seed=None):
+        self.max_nodes = max(1, size_mb * 1024 * 1024 // self.NODE_BYTES)
+        self.rng = random.Random(seed)
+        self.root_state = None
+        self.history = None
+        self.clear()
+
+    # Node fields: move (board * 9 + cell, -1 at the root), first child
+    # (-1 until expanded), child count, visits, and wins for the player
+    # who made the move, with draws counting half.
+    def clear(self):
+        self.move = [-1]
+        self.first_child = [-1]
+        self.child_count = [0]
+        self.visits = [0]
+        self.wins = [0.0]
+
+    def __len__(self):
+        return len(self.move)
+
+    def stats(self):
+        return {
+            'nodes': len(self),
+            'max_nodes': self.max_nodes,
+            'root_visits': self.visits[0],
+        }
+
+    def child(self, node, move):
+        packed = move[0] * 9 + move[1]
+        first = self.first_child[node]
+        if first < 0:
+            return -1
+        for child in range(first, first + self.child_count[node]):
+            if self.move[child] == packed:
+                return child
+        return -1
+
+    # Point the root at `state`. If the position can be reached from the
+    # current root by the moves in `history` past the ones already seen,
+    # the matching subtree is kept; otherwise the tree starts empty.
+    def set_root(self, state, history=None):
+        history = tuple(history) if history is not None else None
+        node = -1
+        if self.root_state is not None:
+            node = 0
+            if history is not None and self.history is not None:
+                if history[:len(self.history)] != self.history:
+                    node = -1
+                else:
+                    for move in history[len(self.history):]:
+                        node = self.child(node, move)
+                        if node < 0:
+                            break
+                        self.root_state.make(*move)
+            if node >= 0 and self.root_state.key != state.key:
+                node = -1
+
+        if node < 0:
+            self.clear()
+        else:
+            self.reroot(node)
+        self.root_state = state.copy()
+        self.root_state.undo_stack = []
+        self.history = history
+
+    # Copy the subtree under `node` into a fresh pool, breadth first, so
+    # every block of children stays contiguous
+    def reroot(self, node):
+        if node == 0:
+            return
+        move, first_child, child_count = [self.move[node]], [-1], [self.child_count[node]]
+        visits, wins = [self.visits[node]], [self.wins[node]]
+        queue = [(node, 0)]
+        for old, new in queue:
+            first = self.first_child[old]
+            if first < 0:
+                continue
+            first_child[new] = len(move)
+            for child in range(first, first + self.child_count[old]):
+                queue.append((child, len(move)))
+                move.append(self.move[child])
+                first_child.append(-1)
+                child_count.append(self.child_count[child])
+                visits.append(self.visits[child])
+                wins.append(self.wins[child])
+        move[0] = -1
+        self.move, self.first_child, self.child_count = move, first_child, child_count
+        self.visits, self.wins = visits, wins
+
+    def expand(self, node, state):
+        moves = list(state.moves())
+        if len(self) + len(moves) > self.max_nodes:
+            return False
+        self.rng.shuffle(moves)
+        self.first_child[node] = len(self)
+        self.child_count[node] = len(moves)
+        for board_idx, cell_idx in moves:
+            self.move.append(board_idx * 9 + cell_idx)
+            self.first_child.append(-1)
+            self.child_count.append(0)
+            self.visits.append(0)
+            self.wins.append(0.0)
+        return True
+
+    # Child with the best upper confidence bound; unvisited children first
+    def select(self, node):
+        first = self.first_child[node]
+        visits, wins = self.visits, self.wins
+        log_parent = math.log(visits[node] or 1)
+        best, best_value = first, -1.0
+        for child in range(first, first + self.child_count[node]):
+            child_visits = visits[child]
+            if child_visits == 0:
+                return child
+            value = wins[child] / child_visits + EXPLORATION * math.sqrt(log_parent / child_visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    # One selection, expansion, playout and backup. Returns the depth of
+    # the leaf below the root.
+    def iterate(self, state):
+        path = [0]
+        node = 0
+        while self.first_child[node] >= 0:
+            node = self.select(node)
+            path.append(node)
+            state.make(*divmod(self.move[node], 9))
+        if not state.game_over and (node == 0 or self.visits[node]) and self.expand(node, state):
+            node = self.first_child[node]
+            path.append(node)
+            state.make(*divmod(self.move[node], 9))
+
+        if state.game_over:
+            winner = None if state.winner == 'Draw' else PLAYERS.index(state.winner)
+        else:
+            winner = playout(state, self.rng)
+        mover = state.side ^ 1
+        for node in reversed(path):
+            self.visits[node] += 1
+            if winner is None:
+                self.wins[node] += 0.5
+            elif winner == mover:
+                self.wins[node] += 1.0
+            mover ^= 1
+        for _ in range(len(path) - 1):
+            state.unmake()
+        return len(path) - 1
+
+    # Run iterations until the deadline or the iteration count is reached.
+    # Returns the number of iterations and the deepest leaf reached.
+    def run(self, time_budget_ms=None, iterations=None):
+        if iterations is None:
+            iterations = MCTS_ITERATIONS if time_budget_ms is None else math.inf
+        deadline = time.perf_counter() + time_budget_ms / 1000 if time_budget_ms is not None else None
+        state = self.root_state
+        done = max_depth = 0
+        while done < iterations:
+            max_depth = max(max_depth, self.iterate(state))
+            done += 1
+            if (deadline is not None and done % DEADLINE_CHECK_ITERATIONS == 0
+                    and time.perf_counter() >= deadline):
+                break
+        return done, max_depth
+
+    # (move, visits, wins) for every child of the root
+    def root_children(self):
+        first = self.first_child[0]
+        if first < 0:
+            return []
+        return [(divmod(self.move[child], 9), self.visits[child], self.wins[child])
+                for child in range(first, first + self.child_count[0])]
+
+    # Most visited line from the root
+    def principal_variation(self):
+        pv = []
+        node = 0
+        while self.first_child[node] >= 0:
+            first = self.first_child[node]
+            node = max(range(first, first + self.child_count[node]), key=self.visits.__getitem__)
+            if not self.visits[node]:
+                break
+            pv.append(divmod(self.move[node], 9))
+        return pv
+
+    # Search from `state` and return the most visited move and its score
+    # (from O's point of view, on the same scale as evaluate_state).
+    # history is the game's moves so far, used to reuse the last tree.
+    def search(self, state, history=None, time_budget_ms=None, iterations=None):
+        self.set_root(state, history)
+        self.run(time_budget_ms, iterations)
+        return best_root_move(self.root_children(), state.side)
+
+# Most visited move of merged root statistics, and its score for O
+def best_root_move(children, side):
+    if not children:
+        return None, None
+    move, visits, wins = max(children, key=lambda child: child[1])
+    win_rate = wins / visits if visits else 0.5
+    score = round((2 * win_rate - 1) * (WIN_SCORE - 1))
+    return move, score if side == O else -score
+
+# Worker side of root-parallel MCTS: an independent tree from `state`
+def search_worker(state, time_budget_ms, iterations, seed):
+    tree = MctsTree(seed=seed)
+    tree.set_root(state)
+    done, max_depth = tree.run(time_budget_ms, iterations)
+    return tree.root_children(), done, max_depth
+
+# Shared by every MCTS search in this server process
+SEARCH_TREE = MctsTree()
+
+# MCTS counterpart of search.ai_move, reached through
+# ai_move(engine='mcts'). Without a time budget it runs MCTS_ITERATIONS
+# playouts. With parallel=True each worker of the shared process pool
+# grows its own tree from the root while this process grows the reused
+# one, and the root visit counts are added up before choosing.
+def mcts_move(state, tree=SEARCH_TREE, time_budget_ms=None, iterations=None, parallel=False,
+              book=SEARCH_BOOK, return_stats=False, seed=None, solve_endgame=True):
+    started = time.perf_counter()
+    bits = BitState.from_dict(state, 'O')
+    history = [(board_idx, cell_idx) for _, board_idx, cell_idx in state.get('move_history', [])]
+    entry = book.lookup(bits) if book is not None else None
+    pv = []
+    solved = None
+    solver_ctx = SearchContext()
+    if entry is not None and bits.is_legal(*entry[0]):
+        best_move, best_score = entry[0], None
+        done = max_depth = 0
+    else:
+        entry = None
+        if solve_endgame:
+            solved = run_solver(bits, solver_ctx, started, time_budget_ms)
+    if solved is not None:
+        best_move, best_score = solved
+        done, max_depth = solver_ctx.nodes, solver_ctx.completed_depth
+        pv = [best_move]
+    elif entry is None:
+        if time_budget_ms is not None:
+            time_budget_ms = max(0.0, time_budget_ms - (time.perf_counter() - started) * 1000)
+        futures = []
+        if parallel:
+            from .parallel import SEARCH_WORKERS, get_search_pool
+            pool = get_search_pool()
+            rng = random.Random(seed)
+            futures = [pool.submit(search_worker, bits, time_budget_ms, iterations, rng.getrandbits(32))
+                       for _ in range(SEARCH_WORKERS)]
+        tree.set_root(bits, history)
+        done, max_depth = tree.run(time_budget_ms, iterations)
+
+        merged = {move: [visits, wins] for move, visits, wins in tree.root_children()}
+        for future in futures:
+            children, worker_done, worker_depth = future.result()
+            done += worker_done
+            max_depth = max(max_depth, worker_depth)
+            for move, visits, wins in children:
+                totals = merged.setdefault(move, [0, 0.0])
+                totals[0] += visits
+                totals[1] += wins
+        best_move, best_score = best_root_move(
+            [(move, visits, wins) for move, (visits, wins) in merged.items()], bits.side)
+        pv = tree.principal_variation()
+        if pv[:1] != [best_move]:
+            pv = [best_move] if best_move is not None else []
+
+    total_ms = (time.perf_counter() - started) * 1000
+    stats = SearchStats(
+        move=best_move,
+        score=best_score,
+        depth=max_depth,
+        nodes=done,
+        cutoffs=0,
+        first_move_cutoffs=0,
+        pvs_researches=0,
+        aspiration_researches=0,
+        tt_hit_rate=0.0,
+        book_hit=entry is not None,
+        solved=solved is not None,
+        cache_hit=False,
+        total_ms=total_ms,
+        movegen_ms=0.0,
+        make_ms=0.0,
+        eval_ms=0.0,
+        pv=pv,
+    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': 'mcts_move', 'tree_nodes': len(tree), **stats.as_dict()}))
+
+    if return_stats:
+        return best_move, stats
+    return best_move
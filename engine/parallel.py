@@ -0,0 +1,77 @@
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .search import SEARCH_TT, SearchContext, SearchTimeout, minimax
+from .tables import O
+
+# Root-parallel search.
+# Root moves are scored in a process pool that is started on first use and
+# reused for every later search in this server process. Each worker keeps
+# its own transposition table across turns. Root order and tie-breaking
+# are decided here, so with tt=None the result matches search_root.
+# Every task carries the id of its search, and a worker starts a new
+# table generation when the id changes, so entries from earlier searches
+# can be replaced as in the server's own table.
+SEARCH_WORKERS = os.cpu_count() or 1
+_search_pool = None
+_search_ids = itertools.count(1)
+_worker_search_id = None
+
+def next_search_id():
+    return next(_search_ids)
+
+def get_search_pool(workers=None):
+    global _search_pool
+    if _search_pool is None:
+        _search_pool = ProcessPoolExecutor(max_workers=workers or SEARCH_WORKERS)
+    return _search_pool
+
+def shutdown_search_pool():
+    global _search_pool
+    if _search_pool is not None:
+        _search_pool.shutdown(cancel_futures=True)
+        _search_pool = None
+
+# Worker side: score one root move, or None if the deadline passed
+def score_root_move(state, move, depth, use_tt, deadline, orderer, timed, batch_eval, search_id):
+    global _worker_search_id
+    if use_tt and search_id != _worker_search_id:
+        SEARCH_TT.new_search()
+        _worker_search_id = search_id
+    ctx = SearchContext(SEARCH_TT if use_tt else None, deadline, orderer, timed, batch_eval=batch_eval)
+    ctx.start_iteration(depth)
+    state.make(*move)
+    try:
+        score = minimax(state, depth - 1, -math.inf, math.inf, state.side == O, ctx)
+    except SearchTimeout:
+        return None
+    ctx.collect_timings(state)
+    return score, ctx.pv[1], ctx.counters()
+
+def parallel_search_root(state, depth, ctx, pool, search_id):
+    ctx.start_iteration(depth)
+    moves = state.moves()
+    moves = ctx.orderer.order(state, moves, 0, ctx.pv_move(moves, 0))
+    futures = [
+        pool.submit(score_root_move, state, move, depth, ctx.tt is not None, ctx.deadline, ctx.orderer,
+                    ctx.timed, ctx.batch_eval, search_id)
+        for move in moves
+    ]
+    results = [future.result() for future in futures]
+    if any(result is None for result in results):
+        raise SearchTimeout
+    
+    maximizing = state.side == O
+    best_score = -math.inf if maximizing else math.inf
+    best_move = None
+    for move, (score, pv, counters) in zip(moves, results):
+        ctx.add_counters(counters)
+        if score > best_score if maximizing else score < best_score:
+            best_score = score
+            best_move = move
+            ctx.pv[0] = [move] + pv
+    
+    ctx.completed_depth = depth
+    return best_move, best_score
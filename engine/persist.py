@@ -0,0 +1,275 @@
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from .symmetry import INVERSE, canonical_key, transform_move
+
+# Game-state serialization and pluggable stores.
+# A dict state packs into a few dozen bytes: an 8-byte header (version,
+# next_board, flags, history length, start time), 2 bits per cell for the
+# 81 cells, 2 bits per board status, then one byte per move of the
+# history. Everything else in the dict (empty cells, history labels) is
+# rebuilt on load, so a state restores in microseconds without replaying
+# the game.
+#
+# A store keeps serialized games by session id, and search results by
+# position and engine: the canonical key of the position, with the move in
+# canonical orientation, so all 8 symmetric variants share one entry. A
+# result only replaces a shallower one, or any one if it is solved. Any
+# replica pointed at the same store can resume a game or reuse a search.
+# Both kinds are capped; every PRUNE_INTERVAL writes of a kind, the
+# entries written longest ago are dropped down to the cap.
+
+STATE_VERSION = 1
+STATE_HEADER = struct.Struct('<BBBBI')
+CELL_CODES = ('', 'X', 'O')
+STATUS_CODES = (None, 'X', 'O', 'D')
+WINNER_CODES = (None, 'X', 'O', 'Draw')
+RESULT = struct.Struct('<BhB?')
+MAX_GAMES = 100000
+MAX_RESULTS = 1 << 20
+PRUNE_INTERVAL = 1000
+
+# Cell values held by each byte of the packed board, 4 cells per byte
+BYTE_CELLS = tuple(tuple(CELL_CODES[min(2, byte >> shift & 3)] for shift in (0, 2, 4, 6))
+                   for byte in range(256))
+
+def pack_codes(codes):
+    data = bytearray((len(codes) + 3) // 4)
+    for i, code in enumerate(codes):
+        data[i // 4] |= code << (i % 4 * 2)
+    return bytes(data)
+
+def serialize_state(state):
+    next_board = 9 if state['next_board'] is None else state['next_board']
+    flags = (state['current_player'] == 'O') | WINNER_CODES.index(state['winner']) << 1
+    flags |= bool(state.get('recorded')) << 3
+    history = state['move_history']
+    header = STATE_HEADER.pack(STATE_VERSION, next_board, flags, len(history), int(state['start_time']))
+    cells = pack_codes([CELL_CODES.index(value) for board in state['board'] for value in board])
+    status = pack_codes([STATUS_CODES.index(value) for value in state['small_board_status']])
+    return header + cells + status + bytes(board_idx * 9 + cell_idx for _, board_idx, cell_idx in history)
+
+def deserialize_state(data):
+    version, next_board, flags, moves, start_time = STATE_HEADER.unpack_from(data, 0)
+    if version != STATE_VERSION:
+        raise ValueError(f"unsupported game state version {version}")
+    offset = STATE_HEADER.size
+    cells = [value for byte in data[offset:offset + 21] for value in BYTE_CELLS[byte]]
+    offset += 21
+    status_bits = int.from_bytes(data[offset:offset + 3], 'little')
+    offset += 3
+    board = [cells[board_idx * 9:board_idx * 9 + 9] for board_idx in range(9)]
+    winner = WINNER_CODES[flags >> 1 & 3]
+    state = {
+        'board': board,
+        'small_board_status': [STATUS_CODES[status_bits >> (board_idx * 2) & 3] for board_idx in range(9)],
+        'empty_cells': [{cell_idx for cell_idx in range(9) if not board_cells[cell_idx]}
+                        for board_cells in board],
+        'next_board': None if next_board == 9 else next_board,
+        'current_player': 'O' if flags & 1 else 'X',
+        'game_over': winner is not None,
+        'winner': winner,
+        'move_history': [('Human' if ply % 2 == 0 else 'AI', *divmod(move, 9))
+                         for ply, move in enumerate(data[offset:offset + moves])],
+        'start_time': start_time,
+    }
+    if flags & 8:
+        state['recorded'] = True
+    return state
+
+def signed_key(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+# Base class: subclasses store raw bytes by session id and by (position
+# key, engine), and drop the oldest entries of a kind on prune(). Search
+# results are (move, score, depth, solved) for a BitState, with the score
+# from O's point of view.
+class GameStore:
+    def __init__(self, max_games=MAX_GAMES, max_results=MAX_RESULTS):
+        self.limits = {'games': max_games, 'results': max_results}
+        self.writes = {'games': 0, 'results': 0}
+
+    def wrote(self, kind):
+        self.writes[kind] += 1
+        if self.writes[kind] % PRUNE_INTERVAL == 0:
+            self.prune(kind, self.limits[kind])
+
+    def save(self, session_id, state):
+        self.put_blob(session_id, serialize_state(state))
+        self.wrote('games')
+
+    # The saved state, or None
+    def load(self, session_id):
+        data = self.get_blob(session_id)
+        return deserialize_state(data) if data is not None else None
+
+    def lookup(self, state, engine='alphabeta'):
+        key, sym = canonical_key(state)
+        data = self.get_result(signed_key(key), engine)
+        if data is None:
+            return None
+        move, score, depth, solved = RESULT.unpack(data)
+        return transform_move(divmod(move, 9), INVERSE[sym]), score, depth, solved
+
+    def store(self, state, move, score, depth, engine='alphabeta', solved=False):
+        key, sym = canonical_key(state)
+        key = signed_key(key)
+        if not solved:
+            old = self.get_result(key, engine)
+            if old is not None:
+                _, _, old_depth, old_solved = RESULT.unpack(old)
+                if old_solved or depth < old_depth:
+                    return
+        board_idx, cell_idx = transform_move(move, sym)
+        self.put_result(key, engine, RESULT.pack(board_idx * 9 + cell_idx, score, min(depth, 255), solved))
+        self.wrote('results')
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    # Keep the `limit` most recently written entries of `kind`
+    def prune(self, kind, limit):
+        raise NotImplementedError
+
+    def put_blob(self, session_id, data):
+        raise NotImplementedError
+
+    def get_blob(self, session_id):
+        raise NotImplementedError
+
+    def put_result(self, key, engine, data):
+        raise NotImplementedError
+
+    def get_result(self, key, engine):
+        raise NotImplementedError
+
+# One small file per game and per search result under `directory`
+class FileStore(GameStore):
+    def __init__(self, directory, max_games=MAX_GAMES, max_results=MAX_RESULTS):
+        super().__init__(max_games, max_results)
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'games'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'results'), exist_ok=True)
+
+    def game_path(self, session_id):
+        if not session_id.isalnum():
+            raise ValueError(f"invalid session id {session_id!r}")
+        return os.path.join(self.directory, 'games', session_id)
+
+    def result_path(self, key, engine):
+        return os.path.join(self.directory, 'results', f'{key & 0xFFFFFFFFFFFFFFFF:016x}.{engine}')
+
+    def write(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as out_file:
+            out_file.write(data)
+        os.replace(tmp_path, path)
+
+    def read(self, path):
+        try:
+            with open(path, 'rb') as in_file:
+                return in_file.read()
+        except FileNotFoundError:
+            return None
+
+    def put_blob(self, session_id, data):
+        self.write(self.game_path(session_id), data)
+
+    def get_blob(self, session_id):
+        return self.read(self.game_path(session_id))
+
+    def delete(self, session_id):
+        try:
+            os.remove(self.game_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def put_result(self, key, engine, data):
+        self.write(self.result_path(key, engine), data)
+
+    def get_result(self, key, engine):
+        return self.read(self.result_path(key, engine))
+
+    def prune(self, kind, limit):
+        with os.scandir(os.path.join(self.directory, kind)) as entries:
+            files = [(entry.stat().st_mtime, entry.path) for entry in entries
+                     if not entry.name.endswith('.tmp')]
+        if len(files) <= limit:
+            return
+        files.sort()
+        for _, path in files[:len(files) - limit]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+# Both tables in one SQLite database. Connections are per thread, since
+# Streamlit runs each session in its own thread.
+class SQLiteStore(GameStore):
+    def __init__(self, path, max_games=MAX_GAMES, max_results=MAX_RESULTS):
+        super().__init__(max_games, max_results)
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS games '
+                               '(session_id TEXT PRIMARY KEY, data BLOB, written REAL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS results '
+                               '(key INTEGER, engine TEXT, data BLOB, written REAL, PRIMARY KEY (key, engine))')
+            connection.execute('CREATE INDEX IF NOT EXISTS games_written ON games (written)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_written ON results (written)')
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+        return connection
+
+    # Pickled (e.g. for the AI worker pool) without the open connections
+    def __getstate__(self):
+        return {'path': self.path, 'limits': self.limits}
+
+    def __setstate__(self, fields):
+        GameStore.__init__(self, fields['limits']['games'], fields['limits']['results'])
+        self.path = fields['path']
+        self.local = threading.local()
+
+    def put_blob(self, session_id, data):
+        with self.connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?)', (session_id, data, time.time()))
+
+    def get_blob(self, session_id):
+        row = self.connection().execute('SELECT data FROM games WHERE session_id = ?', (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        with self.connection() as connection:
+            connection.execute('DELETE FROM games WHERE session_id = ?', (session_id,))
+
+    def put_result(self, key, engine, data):
+        with self.connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                               (key, engine, data, time.time()))
+
+    def get_result(self, key, engine):
+        row = self.connection().execute('SELECT data FROM results WHERE key = ? AND engine = ?',
+                                        (key, engine)).fetchone()
+        return row[0] if row else None
+
+    def prune(self, kind, limit):
+        with self.connection() as connection:
+            connection.execute(f'DELETE FROM {kind} WHERE rowid IN '
+                               f'(SELECT rowid FROM {kind} ORDER BY written DESC LIMIT -1 OFFSET ?)', (limit,))
+
+# Store from a spec such as 'sqlite:games.db' or 'file:games/'
+def open_store(spec):
+    kind, _, location = spec.partition(':')
+    if kind == 'sqlite':
+        return SQLiteStore(location)
+    if kind == 'file':
+        return FileStore(location)
+    raise ValueError(f"unknown store {spec!r}, expected sqlite:PATH or file:DIR")
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from .bitboard import BitState
+from .mcts import MctsTree
+from .search import SEARCH_TT, HeuristicOrderer, SearchContext, SearchTimeout, search_root
+from .tables import WIN_SCORE
+
+# Pondering: searching on the opponent's time.
+# Once the AI's move is on the board, a Ponderer searches the position
+# with the human to move in a background thread until the human's move
+# arrives. With alpha-beta the thread deepens over every human reply and
+# fills the shared transposition table, so the AI's next search starts
+# with its hash moves and bounds. With MCTS it grows the session's tree
+# under the current position, and the next search keeps the subtree of
+# the move the human actually played.
+#
+# A thread rather than a process keeps the table and tree shared. One
+# Ponderer belongs to one game session, but only one ponders at a time in
+# a process: starting one stops any other, and stop_pondering() is called
+# before every foreground search so pondering never competes with it.
+
+PONDER_LIMIT_MS = 60_000
+PONDER_CHUNK = 64
+
+_active_lock = threading.Lock()
+_active = None
+
+# Stop whichever ponderer is running in this process
+def stop_pondering():
+    with _active_lock:
+        ponderer = _active
+    if ponderer is not None:
+        ponderer.stop()
+
+class Ponderer:
+    def __init__(self, engine='alphabeta', tt=SEARCH_TT, max_depth=81, limit_ms=PONDER_LIMIT_MS):
+        self.engine = engine
+        self.tt = tt
+        self.tree = MctsTree() if engine == 'mcts' else None
+        self.max_depth = max_depth
+        self.limit_ms = limit_ms
+        self.thread = None
+        self.ctx = None
+        self.stopping = threading.Event()
+        self.nodes = 0
+        self.depth = 0
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # Start pondering on a dict state where the human is to move
+    def start(self, state):
+        global _active
+        self.stop()
+        stop_pondering()
+        bits = BitState.from_dict(state)
+        if bits.game_over:
+            return
+        history = [(board_idx, cell_idx) for _, board_idx, cell_idx in state['move_history']]
+        deadline = time.perf_counter() + self.limit_ms / 1000
+        self.stopping.clear()
+        self.nodes = self.depth = 0
+        if self.tree is not None:
+            self.ctx = None
+            target, args = self.ponder_mcts, (bits, history, deadline)
+        else:
+            # Made here so stop() can always reach the deadline
+            self.ctx = SearchContext(self.tt, deadline, HeuristicOrderer())
+            target, args = self.ponder_alphabeta, (bits, self.ctx)
+        self.thread = threading.Thread(target=target, args=args, name='ponder', daemon=True)
+        with _active_lock:
+            _active = self
+        self.thread.start()
+
+    # Stop pondering and wait for the thread. Returns what was searched
+    # since start(), and zeros if nothing was.
+    def stop(self):
+        global _active
+        thread, ctx = self.thread, self.ctx
+        if thread is not None:
+            self.stopping.set()
+            if ctx is not None:
+                ctx.deadline = 0.0
+            thread.join()
+            self.thread = None
+            self.ctx = None
+        with _active_lock:
+            if _active is self:
+                _active = None
+        searched = {'nodes': self.nodes, 'depth': self.depth}
+        self.nodes = self.depth = 0
+        return searched
+
+    def ponder_alphabeta(self, bits, ctx):
+        max_depth = min(self.max_depth, bits.open_cells())
+        for depth in range(1, max_depth + 1):
+            try:
+                _, score = search_root(bits, depth, ctx)
+            except SearchTimeout:
+                break
+            self.depth = depth
+            self.nodes = ctx.nodes
+            if abs(score) >= WIN_SCORE or self.stopping.is_set():
+                break
+        self.nodes = ctx.nodes
+
+    def ponder_mcts(self, bits, history, deadline):
+        self.tree.set_root(bits, history)
+        while not self.stopping.is_set() and time.perf_counter() < deadline:
+            done, depth = self.tree.run(iterations=PONDER_CHUNK)
+            self.nodes += done
+            self.depth = max(self.depth, depth)
@@ -0,0 +1,164 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+from .bitboard import BitState
+from .game import init_game, make_move
+
+# Compact game records and a position index over them.
+# A record is an 8-byte header (magic, version, result, move count) and
+# then one byte per move, board * 9 + cell. Records are appended to a
+# games file back to back, so a game is identified by its byte offset.
+#
+# The index maps the Zobrist key of every position reached in a games
+# file to the offsets of the games that reached it: a 16-byte header,
+# then (key, offset) pairs sorted by key. It is memory-mapped and looked
+# up by binary search.
+#
+#   python -m engine.records --from-jsonl selfplay.jsonl games.bin
+#   python -m engine.records --index games.bin
+
+RECORD_MAGIC = b'UTTG'
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct('<4sBBH')
+RESULTS = (None, 'X', 'O', 'Draw')
+
+INDEX_MAGIC = b'UTTI'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sHxxQ')
+INDEX_ENTRY = struct.Struct('<QQ')
+
+GAMES_PATH = 'games.bin'
+
+def encode_game(moves, winner=None):
+    header = RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, RESULTS.index(winner), len(moves))
+    return header + bytes(board_idx * 9 + cell_idx for board_idx, cell_idx in moves)
+
+# (moves, winner, offset of the next record) for the record at `offset`
+def decode_game(data, offset=0):
+    magic, version, result, count = RECORD_HEADER.unpack_from(data, offset)
+    if magic != RECORD_MAGIC or version != RECORD_VERSION:
+        raise ValueError(f"no version {RECORD_VERSION} game record at offset {offset}")
+    start = offset + RECORD_HEADER.size
+    moves = [divmod(move, 9) for move in data[start:start + count]]
+    return moves, RESULTS[result], start + count
+
+# Every (offset, moves, winner) in a games file
+def read_games(path):
+    with open(path, 'rb') as games_file:
+        data = games_file.read()
+    offset = 0
+    while offset < len(data):
+        moves, winner, next_offset = decode_game(data, offset)
+        yield offset, moves, winner
+        offset = next_offset
+
+# Append a game and return its offset
+def append_game(path, moves, winner=None):
+    with open(path, 'ab') as games_file:
+        offset = games_file.tell()
+        games_file.write(encode_game(moves, winner))
+    return offset
+
+# Dict state after the first `plies` moves (all of them by default),
+# played through make_move from a new game. X is recorded as the human
+# and O as the AI, as in the UI.
+def replay(moves, plies=None):
+    state = init_game()
+    for board_idx, cell_idx in moves[:plies]:
+        player = state['current_player']
+        make_move(state, board_idx, cell_idx, player)
+        state['move_history'].append(('Human' if player == 'X' else 'AI', board_idx, cell_idx))
+    return state
+
+# Keys of every position a game passes through, the start included
+def position_keys(moves):
+    state = BitState()
+    keys = [state.key]
+    for move in moves:
+        state.make(*move)
+        keys.append(state.key)
+    return keys
+
+def build_index(games_path, index_path=None):
+    index_path = index_path or games_path + '.idx'
+    entries = set()
+    for offset, moves, _ in read_games(games_path):
+        entries.update((key, offset) for key in position_keys(moves))
+    data = bytearray(INDEX_HEADER.size + len(entries) * INDEX_ENTRY.size)
+    INDEX_HEADER.pack_into(data, 0, INDEX_MAGIC, INDEX_VERSION, len(entries))
+    for i, entry in enumerate(sorted(entries)):
+        INDEX_ENTRY.pack_into(data, INDEX_HEADER.size + i * INDEX_ENTRY.size, *entry)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(data)
+    os.replace(tmp_path, index_path)
+    return len(entries)
+
+class GameIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self.data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = INDEX_HEADER.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} game index")
+
+    def entry(self, i):
+        return INDEX_ENTRY.unpack_from(self.data, INDEX_HEADER.size + i * INDEX_ENTRY.size)
+
+    # Offsets of the games that reached the position with this key
+    def lookup(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        offsets = []
+        while low < self.count:
+            entry_key, offset = self.entry(low)
+            if entry_key != key:
+                break
+            offsets.append(offset)
+            low += 1
+        return offsets
+
+    # Offsets of the games that reached a dict state's position
+    def games_reaching(self, state):
+        return self.lookup(BitState.from_dict(state).key)
+
+    def close(self):
+        self.data.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert, index and inspect game records")
+    parser.add_argument('games', nargs='?', default=GAMES_PATH, help="games file")
+    parser.add_argument('--from-jsonl', metavar='PATH',
+                        help="append the games of a self-play JSON-lines file")
+    parser.add_argument('--index', action='store_true', help="(re)build the position index")
+    args = parser.parse_args(argv)
+
+    if args.from_jsonl:
+        from .selfplay import parse_moves, read_records
+        records = read_records(args.from_jsonl)
+        for record in records:
+            append_game(args.games, parse_moves(record['moves']), record['winner'])
+        print(f"appended {len(records)} games to {args.games}")
+    if args.index:
+        count = build_index(args.games)
+        print(f"indexed {count} positions of {args.games}")
+    if not args.from_jsonl and not args.index:
+        games = list(read_games(args.games))
+        size = os.path.getsize(args.games)
+        print(json.dumps({'games': len(games), 'bytes': size,
+                          'moves': sum(len(moves) for _, moves, _ in games)}))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
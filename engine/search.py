@@ -0,0 +1,577 @@
+import json
+import logging
+import math
+import time
+
+from .bitboard import BitState, TimedBitState
+from .book import SEARCH_BOOK
+from .tables import O, WIN_SCORE, WIN_TABLE
+from .transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Evaluate board state
+# The positional terms are kept incrementally by BitState, so a leaf is
+# scored in constant time. They stay strictly inside the win scores.
+def evaluate_state(state):
+    if state.winner == 'O':
+        return WIN_SCORE
+    elif state.winner == 'X':
+        return -WIN_SCORE
+    elif state.winner == 'Draw':
+        return 0
+    
+    score = state.score + state.macro_score
+    return max(-WIN_SCORE + 1, min(WIN_SCORE - 1, score))
+
+logger = logging.getLogger(__name__)
+
+# Shared by every search in this server process
+TT_SIZE_MB = 64
+SEARCH_TT = TranspositionTable(TT_SIZE_MB)
+
+# Move ordering for alpha-beta.
+# MoveOrderer keeps generation order; HeuristicOrderer tries, in turn, the
+# hash move (PV or table move), moves that win their small board, the two
+# killer moves of this ply, then the rest by history score. Either can be
+# passed to ai_move, or subclassed to try other schemes.
+class MoveOrderer:
+    def order(self, state, moves, ply, hash_move):
+        if hash_move is not None and hash_move in moves:
+            return [hash_move] + [move for move in moves if move != hash_move]
+        return moves
+
+    def record_cutoff(self, state, move, ply, depth):
+        pass
+
+class HeuristicOrderer(MoveOrderer):
+    HASH_SCORE = 1 << 40
+    WIN_SCORE = 1 << 39
+    KILLER_SCORES = (1 << 38, 1 << 37)
+
+    def __init__(self, max_ply=82):
+        self.killers = [[None, None] for _ in range(max_ply)]
+        self.history = [[0] * 81 for _ in range(2)]
+
+    def order(self, state, moves, ply, hash_move):
+        if len(moves) < 2:
+            return moves
+        side = state.side
+        cells = state.cells[side]
+        killers = self.killers[ply]
+        history = self.history[side]
+
+        def score(move):
+            board_idx, cell_idx = move
+            if move == hash_move:
+                return self.HASH_SCORE
+            if WIN_TABLE[cells[board_idx] | (1 << cell_idx)]:
+                return self.WIN_SCORE
+            if move == killers[0]:
+                return self.KILLER_SCORES[0]
+            if move == killers[1]:
+                return self.KILLER_SCORES[1]
+            return history[board_idx * 9 + cell_idx]
+
+        return sorted(moves, key=score, reverse=True)
+
+    # Quiet moves that cause a cutoff become killers for the ply and earn
+    # history credit, weighted towards cutoffs far from the leaves
+    def record_cutoff(self, state, move, ply, depth):
+        board_idx, cell_idx = move
+        if WIN_TABLE[state.cells[state.side][board_idx] | (1 << cell_idx)]:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[state.side][board_idx * 9 + cell_idx] += depth * depth
+
+# Raised inside minimax when an anytime search runs out of time
+class SearchTimeout(Exception):
+    pass
+
+# Per-search state threaded through minimax.
+# pv[ply] holds the best line found from that ply; prev_pv is the line
+# from the previous iteration, followed first while the search is on it.
+# completed_pv is the line of the last iteration run_search finished, the
+# one that goes with the move it returns.
+# sample_hook, if set, is called as sample_hook(ctx, state) every
+# SAMPLE_NODES nodes, e.g. to record what the search is looking at.
+# batch_eval, if set, scores all the leaf children of a depth-1 node in
+# one call (see engine.batch_eval.score_children).
+class SearchContext:
+    DEADLINE_CHECK_NODES = 1024
+    SAMPLE_NODES = 4096
+    COUNTERS = ('nodes', 'cutoffs', 'first_move_cutoffs', 'pvs_researches', 'aspiration_researches',
+                'movegen_time', 'make_time', 'eval_time')
+
+    def __init__(self, tt=None, deadline=None, orderer=None, timed=False, sample_hook=None,
+                 batch_eval=None):
+        self.tt = tt
+        self.deadline = deadline
+        self.orderer = orderer or MoveOrderer()
+        self.timed = timed
+        self.sample_hook = sample_hook
+        self.batch_eval = batch_eval
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.pvs_researches = 0
+        self.aspiration_researches = 0
+        self.movegen_time = 0.0
+        self.make_time = 0.0
+        self.eval_time = 0.0
+        self.book_hit = False
+        self.solved = False
+        self.root_depth = 0
+        self.completed_depth = 0
+        self.pv = []
+        self.prev_pv = []
+        self.completed_pv = []
+        self.follow_pv = False
+
+    def start_iteration(self, depth):
+        self.root_depth = depth
+        self.prev_pv = self.pv[0] if self.pv else []
+        self.pv = [[] for _ in range(depth + 1)]
+        self.follow_pv = bool(self.prev_pv)
+
+    # The previous iteration's move for this ply, while the search is
+    # still walking down the previous principal variation
+    def pv_move(self, moves, ply):
+        if not self.follow_pv:
+            return None
+        if ply < len(self.prev_pv) and self.prev_pv[ply] in moves:
+            return self.prev_pv[ply]
+        self.follow_pv = False
+        return None
+
+    def record_cutoff(self, state, move, ply, depth, move_number):
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+        self.orderer.record_cutoff(state, move, ply, depth)
+
+    def counters(self):
+        return {name: getattr(self, name) for name in self.COUNTERS}
+
+    # Add counters from another search, e.g. a parallel worker
+    def add_counters(self, counters):
+        for name, value in counters.items():
+            setattr(self, name, getattr(self, name) + value)
+
+    # Move the timings a TimedBitState gathered onto the context
+    def collect_timings(self, state):
+        if isinstance(state, TimedBitState):
+            self.movegen_time += state.movegen_time
+            self.make_time += state.make_time
+            state.movegen_time = state.make_time = 0.0
+
+    def visit(self, state):
+        self.nodes += 1
+        if self.sample_hook is not None and self.nodes % self.SAMPLE_NODES == 0:
+            self.sample_hook(self, state)
+        if (self.deadline is not None and self.nodes % self.DEADLINE_CHECK_NODES == 0
+                and time.perf_counter() >= self.deadline):
+            raise SearchTimeout
+
+# What one ai_move call did. as_dict() is the structured log record;
+# profile holds cProfile output when the search was run with profile=True.
+class SearchStats:
+    __slots__ = ('move', 'score', 'depth', 'nodes', 'cutoffs', 'first_move_cutoffs', 'pvs_researches',
+                 'aspiration_researches', 'tt_hit_rate', 'book_hit', 'solved', 'cache_hit', 'total_ms',
+                 'movegen_ms', 'make_ms', 'eval_ms', 'pv', 'profile')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def nodes_per_sec(self):
+        return self.nodes / (self.total_ms / 1000) if self.total_ms else 0.0
+
+    def as_dict(self):
+        record = {name: getattr(self, name) for name in self.__slots__ if name != 'profile'}
+        record['nodes_per_sec'] = self.nodes_per_sec
+        return record
+
+# Score every child of a depth-1 node with one batch_eval call. All the
+# children are scored, so there is no cutoff, but the value is the same.
+def batch_leaves(state, moves, is_maximizing, ctx):
+    started = time.perf_counter() if ctx.timed else 0.0
+    scores = ctx.batch_eval(state, moves)
+    if ctx.timed:
+        ctx.eval_time += time.perf_counter() - started
+    ctx.nodes += len(moves)
+    pick = max if is_maximizing else min
+    best = pick(range(len(moves)), key=scores.__getitem__)
+    return scores[best], moves[best]
+
+# Principal-variation search of one child. Scores are integers, so a
+# window one point wide only asks whether the child beats the best score
+# so far. The first child gets the full window; the others get the null
+# window and are searched again with the full one only when they do beat
+# it without causing a cutoff.
+def search_child(state, depth, alpha, beta, is_maximizing, ctx, move_number):
+    if move_number == 0 or beta - alpha <= 1:
+        return minimax(state, depth, alpha, beta, is_maximizing, ctx)
+    if is_maximizing:
+        score = minimax(state, depth, beta - 1, beta, True, ctx)
+    else:
+        score = minimax(state, depth, alpha, alpha + 1, False, ctx)
+    if alpha < score < beta:
+        ctx.pvs_researches += 1
+        score = minimax(state, depth, alpha, beta, is_maximizing, ctx)
+    return score
+
+# Minimax with Alpha-Beta Pruning
+def minimax(state, depth, alpha, beta, is_maximizing, ctx):
+    ctx.visit(state)
+    ply = ctx.root_depth - depth
+    ctx.pv[ply] = []
+    if state.game_over or depth == 0:
+        if ctx.timed:
+            started = time.perf_counter()
+            score = evaluate_state(state)
+            ctx.eval_time += time.perf_counter() - started
+            return score
+        return evaluate_state(state)
+    
+    moves = state.moves()
+    if not moves:
+        return 0
+    
+    tt = ctx.tt
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(state.key)
+        if entry is not None:
+            _, entry_depth, score, bound, hash_move, _ = entry
+            if entry_depth >= depth and (bound == EXACT
+                                         or (bound == LOWER and score >= beta)
+                                         or (bound == UPPER and score <= alpha)):
+                return score
+    hash_move = ctx.pv_move(moves, ply) or hash_move
+    moves = ctx.orderer.order(state, moves, ply, hash_move)
+    
+    alpha_orig, beta_orig = alpha, beta
+    best_move = None
+    if depth == 1 and ctx.batch_eval is not None:
+        best_score, best_move = batch_leaves(state, moves, is_maximizing, ctx)
+        ctx.pv[ply] = [best_move]
+    elif is_maximizing:
+        best_score = -math.inf
+        for move_number, (board_idx, cell_idx) in enumerate(moves):
+            state.make(board_idx, cell_idx)
+            eval_score = search_child(state, depth - 1, alpha, beta, False, ctx, move_number)
+            state.unmake()
+            ctx.follow_pv = False
+            if eval_score > best_score:
+                best_score = eval_score
+                best_move = (board_idx, cell_idx)
+                ctx.pv[ply] = [best_move] + ctx.pv[ply + 1]
+            alpha = max(alpha, eval_score)
+            if beta <= alpha:
+                ctx.record_cutoff(state, best_move, ply, depth, move_number)
+                break
+    else:
+        best_score = math.inf
+        for move_number, (board_idx, cell_idx) in enumerate(moves):
+            state.make(board_idx, cell_idx)
+            eval_score = search_child(state, depth - 1, alpha, beta, True, ctx, move_number)
+            state.unmake()
+            ctx.follow_pv = False
+            if eval_score < best_score:
+                best_score = eval_score
+                best_move = (board_idx, cell_idx)
+                ctx.pv[ply] = [best_move] + ctx.pv[ply + 1]
+            beta = min(beta, eval_score)
+            if beta <= alpha:
+                ctx.record_cutoff(state, best_move, ply, depth, move_number)
+                break
+    
+    if tt is not None:
+        if best_score <= alpha_orig:
+            bound = UPPER
+        elif best_score >= beta_orig:
+            bound = LOWER
+        else:
+            bound = EXACT
+        tt.store(state.key, depth, best_score, bound, best_move)
+    return best_score
+
+# Best root move at a fixed depth. Scores are from O's point of view, so
+# O takes the highest and X the lowest. The root is searched as a PVS node
+# within (alpha, beta); a best score at or outside the window is only a
+# bound (see aspiration_search).
+def search_root(state, depth, ctx, alpha=-math.inf, beta=math.inf):
+    ctx.start_iteration(depth)
+    maximizing = state.side == O
+    best_score = -math.inf if maximizing else math.inf
+    best_move = None
+    
+    moves = state.moves()
+    ordered = ctx.orderer.order(state, moves, 0, ctx.pv_move(moves, 0))
+    for move_number, (board_idx, cell_idx) in enumerate(ordered):
+        state.make(board_idx, cell_idx)
+        score = search_child(state, depth - 1, alpha, beta, not maximizing, ctx, move_number)
+        state.unmake()
+        ctx.follow_pv = False
+        if score > best_score if maximizing else score < best_score:
+            best_score = score
+            best_move = (board_idx, cell_idx)
+            ctx.pv[0] = [best_move] + ctx.pv[1]
+        if maximizing:
+            alpha = max(alpha, score)
+        else:
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    
+    ctx.completed_depth = depth
+    return best_move, best_score
+
+# Root search in a window of ASPIRATION_WINDOW either side of the previous
+# iteration's score. When the score lands on or outside the window, the
+# failing side is widened fourfold (to infinity past the win score) and
+# the depth searched again.
+ASPIRATION_WINDOW = 25
+
+def aspiration_search(state, depth, ctx, guess=None):
+    if guess is None or abs(guess) >= WIN_SCORE:
+        return search_root(state, depth, ctx)
+    delta = ASPIRATION_WINDOW
+    alpha, beta = guess - delta, guess + delta
+    while True:
+        best_move, best_score = search_root(state, depth, ctx, alpha, beta)
+        if alpha < best_score < beta:
+            return best_move, best_score
+        ctx.aspiration_researches += 1
+        delta *= 4
+        if best_score <= alpha:
+            alpha = best_score - delta if delta < WIN_SCORE else -math.inf
+        else:
+            beta = best_score + delta if delta < WIN_SCORE else math.inf
+
+# Book lookup, an exact solve once few cells are left, then a fixed-depth
+# or iterative-deepening search. Returns the best move and its score
+# (None for book moves).
+def run_search(state, depth, ctx, time_budget_ms=None, parallel=False, book=None, solve_endgame=True):
+    started = time.perf_counter()
+    if book is not None:
+        entry = book.lookup(state)
+        if entry is not None and state.is_legal(*entry[0]):
+            ctx.book_hit = True
+            return entry[0], None
+    if solve_endgame:
+        solved = run_solver(state, ctx, started, time_budget_ms)
+        if solved is not None:
+            return solved
+    if ctx.tt is not None:
+        ctx.tt.new_search()
+    
+    # Parallel root scores are exact, so only the sequential search
+    # narrows its window around the previous score
+    if parallel:
+        from .parallel import get_search_pool, next_search_id, parallel_search_root
+        pool = get_search_pool()
+        search_id = next_search_id()
+        run_iteration = lambda iteration_depth, guess: parallel_search_root(state, iteration_depth, ctx, pool,
+                                                                            search_id)
+    else:
+        run_iteration = lambda iteration_depth, guess: aspiration_search(state, iteration_depth, ctx, guess)
+    
+    if time_budget_ms is None:
+        best_move, best_score = run_iteration(depth, None)
+        ctx.completed_pv = ctx.pv[0]
+        return best_move, best_score
+    
+    deadline = started + time_budget_ms / 1000
+    best_move = best_score = None
+    played = len(state.undo_stack)
+    for iteration_depth in range(1, depth + 1):
+        try:
+            best_move, best_score = run_iteration(iteration_depth, best_score)
+        except SearchTimeout:
+            # Take back the moves the interrupted search left on the board
+            while len(state.undo_stack) > played:
+                state.unmake()
+            ctx.pv = [ctx.completed_pv]
+            break
+        ctx.completed_pv = ctx.pv[0]
+        # Depth 1 always finishes so there is a move to play
+        ctx.deadline = deadline
+        if abs(best_score) >= WIN_SCORE or time.perf_counter() >= deadline:
+            break
+    return best_move, best_score
+
+# Exact result for positions within engine.endgame.ENDGAME_CELLS of the
+# end, as (move, score) with the score a win or 0. The solver gets at most
+# half of any time budget and returns None if it runs out, so the normal
+# search still has time to play. Lost positions also go to the search,
+# which picks the move that makes the opponent work hardest for the win.
+def run_solver(state, ctx, started, time_budget_ms=None):
+    from .endgame import ENDGAME_CELLS, solve_root
+    cells = state.open_cells()
+    if cells > ENDGAME_CELLS:
+        return None
+    deadline = started + time_budget_ms / 2000 if time_budget_ms is not None else None
+    solved = solve_root(state, deadline)
+    if solved is None:
+        return None
+    move, result, nodes = solved
+    ctx.nodes += nodes
+    if result == (-1 if state.side == O else 1):
+        return None
+    ctx.solved = True
+    ctx.completed_depth = cells
+    ctx.pv = [[move]]
+    ctx.completed_pv = [move]
+    return move, result * WIN_SCORE
+
+def load_batch_eval():
+    from .batch_eval import score_children
+    return score_children
+
+def format_profile(profiler, limit=25):
+    import io
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+# AI move
+# Pass tt=None to search without the shared transposition table. With a
+# time_budget_ms the search deepens one ply at a time up to `depth` and
+# returns the best move of the last iteration that finished in time.
+# orderer defaults to a fresh HeuristicOrderer. With parallel=True root
+# moves are split across the shared process pool. Positions found in the
+# book are answered without searching.
+# With return_stats=True the result is (move, SearchStats). timed=True
+# fills in the move generation, make/unmake and evaluation times,
+# profile=True captures a cProfile report, and sample_hook is handed to
+# SearchContext. Every search is logged as JSON on the engine.search logger.
+# batch_eval=True scores the last ply with NumPy (needs numpy installed).
+# Positions close to the end are solved exactly unless solve_endgame=False.
+# A result_cache (an engine.persist store) keeps every new result and
+# answers positions searched before, by any server sharing it, with the
+# same engine and at least as deep (see cached_move).
+# engine='mcts' hands the move to Monte Carlo tree search (engine.mcts)
+# with the same time budget, parallel flag and book, on `tree` if given
+# (else the shared one); depth and the alpha-beta options are then ignored.
+def ai_move(state, depth=3, tt=SEARCH_TT, time_budget_ms=None, orderer=None, parallel=False,
+            book=SEARCH_BOOK, return_stats=False, timed=False, profile=False, sample_hook=None,
+            batch_eval=False, engine='alphabeta', tree=None, solve_endgame=True, result_cache=None):
+    started = time.perf_counter()
+    stats = None
+    if result_cache is not None:
+        stats = cached_move(BitState.from_dict(state, 'O'), result_cache, engine, depth, time_budget_ms, book,
+                            solve_endgame, started)
+    if stats is not None:
+        best_move = stats.move
+    elif engine == 'mcts':
+        from .mcts import SEARCH_TREE, mcts_move
+        best_move, stats = mcts_move(state, tree or SEARCH_TREE, time_budget_ms=time_budget_ms,
+                                     parallel=parallel, book=book, return_stats=True,
+                                     solve_endgame=solve_endgame)
+    else:
+        best_move, stats = alphabeta_move(state, depth, tt, time_budget_ms, orderer, parallel, book, timed,
+                                          profile, sample_hook, batch_eval, solve_endgame, started)
+    if not stats.cache_hit and not stats.book_hit and not stats.solved:
+        remember_depth(engine, time_budget_ms, stats.depth)
+    if (result_cache is not None and best_move is not None and not stats.book_hit
+            and not stats.cache_hit):
+        result_cache.store(BitState.from_dict(state, 'O'), best_move, stats.score, stats.depth, engine,
+                           stats.solved)
+    
+    if return_stats:
+        return best_move, stats
+    return best_move
+
+# Depth the latest timed search of each (engine, time budget) reached in
+# this process, as what the next one is expected to reach
+REACHED_DEPTHS = {}
+
+def remember_depth(engine, time_budget_ms, depth):
+    if time_budget_ms is not None:
+        REACHED_DEPTHS[engine, round(time_budget_ms)] = depth
+
+# A move from result_cache (see engine.persist) as SearchStats, or None.
+# Positions in the book or within reach of the endgame solver are left to
+# them. Otherwise an entry is used if it is solved, or at least as deep as
+# this search: `depth` for a fixed-depth alpha-beta search, else the depth
+# the last search with the same engine and budget reached.
+def cached_move(bits, result_cache, engine, depth, time_budget_ms, book, solve_endgame, started):
+    if book is not None and book.lookup(bits) is not None:
+        return None
+    if solve_endgame:
+        from .endgame import ENDGAME_CELLS
+        if bits.open_cells() <= ENDGAME_CELLS:
+            return None
+    if engine == 'alphabeta' and time_budget_ms is None:
+        min_depth = depth
+    elif time_budget_ms is not None:
+        min_depth = REACHED_DEPTHS.get((engine, round(time_budget_ms)))
+    else:
+        min_depth = None
+    if min_depth is None:
+        return None
+    entry = result_cache.lookup(bits, engine)
+    if entry is None:
+        return None
+    move, score, depth, solved = entry
+    if not bits.is_legal(*move) or (depth < min_depth and not solved):
+        return None
+    stats = SearchStats(move=move, score=score, depth=depth, nodes=0, cutoffs=0, first_move_cutoffs=0,
+                        pvs_researches=0, aspiration_researches=0, tt_hit_rate=0.0, book_hit=False,
+                        solved=solved, cache_hit=True,
+                        total_ms=(time.perf_counter() - started) * 1000, movegen_ms=0.0, make_ms=0.0,
+                        eval_ms=0.0, pv=[move])
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': 'ai_move', **stats.as_dict()}))
+    return stats
+
+def alphabeta_move(state, depth, tt, time_budget_ms, orderer, parallel, book, timed, profile, sample_hook,
+                   batch_eval, solve_endgame, started):
+    bits = (TimedBitState if timed else BitState).from_dict(state, 'O')
+    ctx = SearchContext(tt, orderer=orderer or HeuristicOrderer(), timed=timed, sample_hook=sample_hook,
+                        batch_eval=load_batch_eval() if batch_eval else None)
+    tt_probes = (tt.hits, tt.misses) if tt is not None else (0, 0)
+    
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        best_move, best_score = run_search(bits, depth, ctx, time_budget_ms, parallel, book, solve_endgame)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    ctx.collect_timings(bits)
+    
+    hits = tt.hits - tt_probes[0] if tt is not None else 0
+    misses = tt.misses - tt_probes[1] if tt is not None else 0
+    stats = SearchStats(
+        move=best_move,
+        score=best_score,
+        depth=ctx.completed_depth,
+        nodes=ctx.nodes,
+        cutoffs=ctx.cutoffs,
+        first_move_cutoffs=ctx.first_move_cutoffs,
+        pvs_researches=ctx.pvs_researches,
+        aspiration_researches=ctx.aspiration_researches,
+        tt_hit_rate=hits / (hits + misses) if hits + misses else 0.0,
+        book_hit=ctx.book_hit,
+        solved=ctx.solved,
+        cache_hit=False,
+        total_ms=(time.perf_counter() - started) * 1000,
+        movegen_ms=ctx.movegen_time * 1000,
+        make_ms=ctx.make_time * 1000,
+        eval_ms=ctx.eval_time * 1000,
+        pv=ctx.completed_pv,
+        profile=format_profile(profiler) if profiler is not None else None,
+    )
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': 'ai_move', **stats.as_dict()}))
+    return best_move, stats
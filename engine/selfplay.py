@@ -0,0 +1,145 @@
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .bench import CONFIGS, make_context, make_tt
+from .bitboard import BitState
+from .mcts import MctsTree
+from .search import run_search
+
+# Headless AI-vs-AI self-play for offline tuning.
+# Two search configurations (names from bench.CONFIGS) play N games in a
+# process pool and swap colours every game. Each game opens with a few
+# seeded random moves so games differ. Finished games are appended to a
+# JSON-lines file as they arrive, one compact object per game:
+#   {"game": 7, "x": "d5", "o": "d4", "moves": "44 40 03 ...", "winner": "X",
+#    "time_x": 1.92, "time_o": 0.41}
+# where each move is written as board digit then cell digit.
+#
+#   python -m engine.selfplay --a d5 --b d4 --games 200 --out games.jsonl
+
+OPENING_PLIES = 2
+
+def play_game(game, config_x, config_o, seed, opening_plies=OPENING_PLIES):
+    rng = random.Random(seed * 1_000_003 + game)
+    state = BitState()
+    moves = []
+    for _ in range(opening_plies):
+        move = rng.choice(sorted(state.moves()))
+        state.make(*move)
+        moves.append(move)
+
+    # One table (or MCTS tree) per side, kept for the whole game
+    configs = (CONFIGS[config_x], CONFIGS[config_o])
+    tables = [MctsTree(seed=rng.getrandbits(32)) if config.get('engine') == 'mcts' else make_tt(config)
+              for config in configs]
+    times = [0.0, 0.0]
+    while not state.game_over:
+        side = state.side
+        config = configs[side]
+        started = time.perf_counter()
+        if config.get('engine') == 'mcts':
+            move, _ = tables[side].search(state, moves, config.get('time_budget_ms'))
+        else:
+            move, _ = run_search(state, config['depth'], make_context(config, tables[side]),
+                                 config.get('time_budget_ms'))
+        times[side] += time.perf_counter() - started
+        state.make(*move)
+        moves.append(move)
+
+    return {
+        'game': game,
+        'x': config_x,
+        'o': config_o,
+        'moves': ' '.join(f'{board_idx}{cell_idx}' for board_idx, cell_idx in moves),
+        'winner': state.winner,
+        'time_x': round(times[0], 4),
+        'time_o': round(times[1], 4),
+    }
+
+def parse_moves(text):
+    return [(int(move[0]), int(move[1])) for move in text.split()]
+
+# Wilson score interval for `hits` successes out of n
+def wilson_interval(hits, n, z=1.96):
+    if n == 0:
+        return 0.0, 0.0
+    p = hits / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+# Win/draw/loss totals for config a against config b, from game records
+def summarize(records, a, b):
+    wins = draws = losses = 0
+    for record in records:
+        if record['winner'] == 'Draw':
+            draws += 1
+            continue
+        winner = record['x'] if record['winner'] == 'X' else record['o']
+        if winner == a:
+            wins += 1
+        elif winner == b:
+            losses += 1
+    games = wins + draws + losses
+    return {
+        'games': games,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'win_rate': wins / games if games else 0.0,
+        'win_rate_ci': wilson_interval(wins, games),
+        'score': (wins + draws / 2) / games if games else 0.0,
+        'score_ci': wilson_interval(wins + draws / 2, games),
+    }
+
+# Play games between configs a and b, appending each finished game to
+# out_path, and return the summary for a
+def run_match(a, b, games, out_path, workers=None, seed=0):
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(out_path, 'a') as out_file:
+        futures = [
+            pool.submit(play_game, game, *((a, b) if game % 2 == 0 else (b, a)), seed)
+            for game in range(games)
+        ]
+        for future in as_completed(futures):
+            record = future.result()
+            out_file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            out_file.flush()
+            records.append(record)
+    return summarize(records, a, b)
+
+def read_records(path):
+    with open(path) as records_file:
+        return [json.loads(line) for line in records_file if line.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play AI-vs-AI Ultimate Tic-Tac-Toe games")
+    parser.add_argument('--a', default='d5', help=f"first config, from: {', '.join(CONFIGS)}")
+    parser.add_argument('--b', default='d4', help="second config")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='selfplay.jsonl', help="game records are appended here")
+    parser.add_argument('--summarize', action='store_true',
+                        help="only summarize the games already in --out")
+    args = parser.parse_args(argv)
+
+    if args.summarize:
+        summary = summarize(read_records(args.out), args.a, args.b)
+    else:
+        summary = run_match(args.a, args.b, args.games, args.out, args.workers, args.seed)
+    low, high = summary['win_rate_ci']
+    print(f"{args.a} vs {args.b}: +{summary['wins']} ={summary['draws']} -{summary['losses']} "
+          f"in {summary['games']} games")
+    print(f"win rate {summary['win_rate']:.1%} (95% CI {low:.1%}-{high:.1%}), "
+          f"score {summary['score']:.1%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
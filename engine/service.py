@@ -0,0 +1,193 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .search import ai_move
+
+# AI worker service shared by every game session of a server.
+# Sessions submit move requests to a job queue; a dispatcher thread feeds
+# them to a process pool, one job per free worker. Scheduling is round
+# robin over sessions with at most one job per session in flight, so a
+# busy session cannot starve the others. Each job's time budget counts
+# from submission, so time spent queued comes out of the search. When the
+# queue is full, submit() raises ServiceBusy instead of queueing more
+# work, and metrics() reports queue depth, waits and job counts.
+#
+# Cancelling a session drops its queued jobs at once. A job already
+# running in a worker cannot be interrupted, but its result is thrown
+# away and the session is free to submit again; the worker is busy for
+# at most the job's time budget.
+#
+# A job that cannot be started or whose worker dies fails with that error
+# instead of hanging, and a broken pool is replaced for the jobs after it.
+
+MIN_SEARCH_MS = 50
+MAX_PENDING = 64
+
+class ServiceBusy(Exception):
+    pass
+
+class AIJob:
+    __slots__ = ('session_id', 'state', 'time_budget_ms', 'options', 'future', 'submitted')
+
+    def __init__(self, session_id, state, time_budget_ms, options):
+        self.session_id = session_id
+        self.state = state
+        self.time_budget_ms = time_budget_ms
+        self.options = options
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+    def done(self):
+        return self.future.done()
+
+    # (move, stats dict); raises CancelledError for cancelled jobs
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+# Worker side
+def run_job(state, time_budget_ms, options):
+    move, stats = ai_move(state, time_budget_ms=time_budget_ms, return_stats=True, **options)
+    return move, stats.as_dict()
+
+class AIService:
+    def __init__(self, workers=None, max_pending=MAX_PENDING):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.condition = threading.Condition()
+        self.queues = OrderedDict()
+        self.in_flight = {}
+        self.busy = 0
+        self.closed = False
+        self.counts = {'submitted': 0, 'completed': 0, 'cancelled': 0, 'rejected': 0, 'failed': 0}
+        self.started = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.dispatcher = threading.Thread(target=self.dispatch, name='ai-service', daemon=True)
+        self.dispatcher.start()
+
+    # Queue a move request for `state` (a dict state with O to move).
+    # options are passed on to ai_move.
+    def submit(self, session_id, state, time_budget_ms, **options):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("AI service is shut down")
+            if sum(len(queue) for queue in self.queues.values()) >= self.max_pending:
+                self.counts['rejected'] += 1
+                raise ServiceBusy(f"{self.max_pending} move requests already queued")
+            job = AIJob(session_id, copy.deepcopy(state), time_budget_ms, options)
+            self.queues.setdefault(session_id, deque()).append(job)
+            self.counts['submitted'] += 1
+            self.condition.notify()
+        return job
+
+    # Drop every queued or running job of a session, e.g. on New Game
+    def cancel_session(self, session_id):
+        with self.condition:
+            for job in self.queues.pop(session_id, ()):
+                if job.future.cancel():
+                    self.counts['cancelled'] += 1
+            job = self.in_flight.pop(session_id, None)
+            if job is not None and not job.future.done():
+                job.future.set_exception(CancelledError())
+                self.counts['cancelled'] += 1
+            self.condition.notify()
+
+    # Next job in round-robin order, or None if no worker or job is free
+    def next_job(self):
+        if self.busy >= self.workers:
+            return None
+        for session_id in list(self.queues):
+            if session_id in self.in_flight:
+                continue
+            queue = self.queues[session_id]
+            job = queue.popleft()
+            if queue:
+                self.queues.move_to_end(session_id)
+            else:
+                del self.queues[session_id]
+            if job.future.set_running_or_notify_cancel():
+                return job
+        return None
+
+    def dispatch(self):
+        with self.condition:
+            while not self.closed:
+                job = self.next_job()
+                if job is None:
+                    self.condition.wait()
+                    continue
+                waited = time.perf_counter() - job.submitted
+                self.started += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                budget = job.time_budget_ms
+                if budget is not None:
+                    budget = max(MIN_SEARCH_MS, budget - waited * 1000)
+                pool = self.pool
+                try:
+                    pool_future = pool.submit(run_job, job.state, budget, job.options)
+                except Exception as error:
+                    self.counts['failed'] += 1
+                    job.future.set_exception(error)
+                    self.restart_pool(pool, error)
+                    continue
+                self.in_flight[job.session_id] = job
+                self.busy += 1
+                pool_future.add_done_callback(
+                    lambda pool_future, job=job, pool=pool: self.finish(job, pool, pool_future))
+
+    # Replace `pool` if its workers died and it is still the current one.
+    # Called with the lock held.
+    def restart_pool(self, pool, error):
+        if isinstance(error, BrokenProcessPool) and pool is self.pool and not self.closed:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def finish(self, job, pool, pool_future):
+        with self.condition:
+            self.busy -= 1
+            if self.in_flight.get(job.session_id) is job:
+                del self.in_flight[job.session_id]
+            if pool_future.cancelled():
+                if not job.future.done():
+                    self.counts['cancelled'] += 1
+                    job.future.set_exception(CancelledError())
+            elif pool_future.exception() is not None:
+                self.restart_pool(pool, pool_future.exception())
+                if not job.future.done():
+                    self.counts['failed'] += 1
+                    job.future.set_exception(pool_future.exception())
+            elif not job.future.done():
+                self.counts['completed'] += 1
+                job.future.set_result(pool_future.result())
+            self.condition.notify()
+
+    def metrics(self):
+        with self.condition:
+            return {
+                'workers': self.workers,
+                'busy': self.busy,
+                'queued': sum(len(queue) for queue in self.queues.values()),
+                'sessions_waiting': len(self.queues),
+                'in_flight': len(self.in_flight),
+                'max_pending': self.max_pending,
+                **self.counts,
+                'mean_wait_ms': self.wait_total / self.started * 1000 if self.started else 0.0,
+                'max_wait_ms': self.wait_max * 1000,
+            }
+
+    def shutdown(self):
+        with self.condition:
+            self.closed = True
+            for session_id in list(self.queues):
+                for job in self.queues.pop(session_id):
+                    job.future.cancel()
+            self.condition.notify()
+        self.dispatcher.join()
+        self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,112 @@
+from .bitboard import BitState
+from .tables import O, X, ZOBRIST_CELLS, ZOBRIST_NEXT, ZOBRIST_SIDE
+
+# Board symmetries.
+# The 8 rotations and reflections of a 3x3 grid act the same way on the
+# macro board and inside every small board, so symmetry s sends cell
+# (board, cell) to (PERMS[s][board], PERMS[s][cell]) and next_board to
+# PERMS[s][next_board]. Symmetric positions have the same value and
+# their best moves map onto each other.
+#
+# canonical_key() is the smallest Zobrist key over the 8 images of a
+# position, which is also the ordinary key of one of those images. It is
+# built from per-(symmetry, side, board) tables indexed by the board's
+# cell mask, so it costs 8 x 18 lookups rather than transforming the
+# position. Stores keyed by it need a single entry for all 8 variants.
+
+def rotate(i):
+    row, col = divmod(i, 3)
+    return col * 3 + 2 - row
+
+def reflect(i):
+    row, col = divmod(i, 3)
+    return row * 3 + 2 - col
+
+# PERMS[s][i] is where symmetry s sends square i; 0 is the identity
+def build_perms():
+    perms = []
+    for reflected in (False, True):
+        perm = [reflect(i) if reflected else i for i in range(9)]
+        for _ in range(4):
+            perms.append(tuple(perm))
+            perm = [rotate(square) for square in perm]
+    return tuple(perms)
+
+PERMS = build_perms()
+INVERSE = tuple(next(t for t in range(8) if all(PERMS[t][PERMS[s][i]] == i for i in range(9)))
+                for s in range(8))
+CELL_PERMS = tuple(tuple(perm[i // 9] * 9 + perm[i % 9] for i in range(81)) for perm in PERMS)
+
+# MASK_PERMS[s][mask]: a 9-bit mask with every square moved by symmetry s
+def build_mask_perms():
+    return tuple(
+        tuple(sum(1 << perm[i] for i in range(9) if mask >> i & 1) for mask in range(512))
+        for perm in PERMS
+    )
+
+MASK_PERMS = build_mask_perms()
+
+# SYM_BOARD_KEYS[s][side][board][mask]: Zobrist keys of `side` holding
+# `mask` in `board`, after symmetry s
+def build_sym_board_keys():
+    tables = []
+    for cell_perm in CELL_PERMS:
+        sides = []
+        for side in (X, O):
+            boards = []
+            for board_idx in range(9):
+                keys = [0] * 512
+                for mask in range(1, 512):
+                    low = mask & -mask
+                    cell = cell_perm[board_idx * 9 + low.bit_length() - 1]
+                    keys[mask] = keys[mask ^ low] ^ ZOBRIST_CELLS[side][cell]
+                boards.append(tuple(keys))
+            sides.append(tuple(boards))
+        tables.append(tuple(sides))
+    return tuple(tables)
+
+SYM_BOARD_KEYS = build_sym_board_keys()
+
+def transform_move(move, sym):
+    perm = PERMS[sym]
+    return perm[move[0]], perm[move[1]]
+
+# Zobrist key of the image of `state` under symmetry sym
+def symmetric_key(state, sym):
+    next_board = state.next_board
+    key = ZOBRIST_NEXT[9 if next_board is None else PERMS[sym][next_board]]
+    if state.side == O:
+        key ^= ZOBRIST_SIDE
+    for side, boards in zip((X, O), SYM_BOARD_KEYS[sym]):
+        cells = state.cells[side]
+        for board_idx in range(9):
+            if cells[board_idx]:
+                key ^= boards[board_idx][cells[board_idx]]
+    return key
+
+# (canonical key, symmetry that maps `state` onto the canonical variant)
+def canonical_key(state):
+    best_key, best_sym = state.key, 0
+    for sym in range(1, 8):
+        key = symmetric_key(state, sym)
+        if key < best_key:
+            best_key, best_sym = key, sym
+    return best_key, best_sym
+
+# New BitState holding the image of `state` under symmetry sym
+def transform_state(state, sym):
+    perm, mask_perm = PERMS[sym], MASK_PERMS[sym]
+    image = BitState()
+    for side in (X, O):
+        for board_idx in range(9):
+            image.cells[side][perm[board_idx]] = mask_perm[state.cells[side][board_idx]]
+    for board_idx in range(9):
+        image.empty[perm[board_idx]] = mask_perm[state.empty[board_idx]]
+    image.macro = [mask_perm[state.macro[X]], mask_perm[state.macro[O]]]
+    image.drawn = mask_perm[state.drawn]
+    image.next_board = None if state.next_board is None else perm[state.next_board]
+    image.side = state.side
+    image.winner = state.winner
+    image.key = image.compute_key()
+    image.compute_scores()
+    return image
@@ -0,0 +1,117 @@
+import functools
+import random
+
+# Lookup tables, built once at import.
+# A 3x3 board is a 9-bit mask (bit i = cell i), so every win and full
+# check is a single index into a 512-entry table.
+X, O = 0, 1
+PLAYERS = ('X', 'O')
+FULL_MASK = 0x1FF
+WIN_MASKS = (0x007, 0x038, 0x1C0, 0x049, 0x092, 0x124, 0x111, 0x054)
+POPCOUNT = tuple(bin(mask).count('1') for mask in range(512))
+
+def build_win_table():
+    return tuple(any(mask & line == line for line in WIN_MASKS) for mask in range(512))
+
+def build_full_table():
+    return tuple(mask == FULL_MASK for mask in range(512))
+
+# Legal moves inside one board, per board and empty-cell mask, in cell order
+def build_board_moves():
+    return tuple(
+        tuple(tuple((board_idx, cell_idx) for cell_idx in range(9) if mask >> cell_idx & 1)
+              for mask in range(512))
+        for board_idx in range(9)
+    )
+
+WIN_TABLE = build_win_table()
+FULL_TABLE = build_full_table()
+BOARD_MOVES = build_board_moves()
+
+# Zobrist keys: one per (player, board * 9 + cell), one per next_board
+# value (index 9 stands for "play anywhere") and one for O to move.
+# A fixed seed keeps keys stable across processes and restarts.
+def build_zobrist(seed=0x5EED):
+    rng = random.Random(seed)
+    cells = tuple(tuple(rng.getrandbits(64) for _ in range(81)) for _ in range(2))
+    next_board = tuple(rng.getrandbits(64) for _ in range(10))
+    return cells, next_board, rng.getrandbits(64)
+
+ZOBRIST_CELLS, ZOBRIST_NEXT, ZOBRIST_SIDE = build_zobrist()
+
+# Evaluation weights, all from O's point of view (X scores are negated).
+# Inside an undecided small board: two in a line with the third cell empty
+# is a threat, one alone in an open line is potential, and the centre and
+# corners are worth more than edges. On the macro board: won boards count
+# by position, and lines of won boards not blocked by the opponent or a
+# draw count the same way as small-board threats, only larger.
+CELL_WEIGHTS = (3, 2, 3, 2, 4, 2, 3, 2, 3)
+SMALL_THREAT = 6
+SMALL_OPEN = 1
+WON_BOARD = 20
+BOARD_WEIGHTS = tuple(5 * weight for weight in CELL_WEIGHTS)
+MACRO_THREAT = 60
+MACRO_OPEN = 10
+WIN_SCORE = 1000
+
+# Value of one line given how many of its cells each player holds
+def line_value(x_count, o_count, threat, single):
+    if x_count == 0 and o_count:
+        return threat if o_count == 2 else single
+    if o_count == 0 and x_count:
+        return -threat if x_count == 2 else -single
+    return 0
+
+def line_score(x_mask, o_mask, threat, single):
+    return sum(line_value(POPCOUNT[x_mask & line], POPCOUNT[o_mask & line], threat, single)
+               for line in WIN_MASKS)
+
+# Score of an undecided small board, indexed by x_mask << 9 | o_mask.
+# Scores add up over lines and cells, so each line's contribution is
+# looked up from the few patterns it can hold, and every x_mask is walked
+# as a submask of the cells O leaves free.
+def build_small_eval():
+    weights = [sum(CELL_WEIGHTS[i] for i in range(9) if mask >> i & 1) for mask in range(512)]
+    line_values = []
+    for line in WIN_MASKS:
+        bits = [mask for mask in range(512) if mask & ~line == 0]
+        values = {(x_mask, o_mask): line_value(POPCOUNT[x_mask], POPCOUNT[o_mask], SMALL_THREAT, SMALL_OPEN)
+                  for x_mask in bits for o_mask in bits if x_mask & o_mask == 0}
+        line_values.append((line, values))
+
+    table = [0] * (512 * 512)
+    for o_mask in range(512):
+        free = FULL_MASK & ~o_mask
+        x_mask = free
+        while True:
+            score = weights[o_mask] - weights[x_mask]
+            for line, values in line_values:
+                score += values[x_mask & line, o_mask & line]
+            table[x_mask << 9 | o_mask] = score
+            if x_mask == 0:
+                break
+            x_mask = (x_mask - 1) & free
+    return table
+
+SMALL_EVAL = build_small_eval()
+
+# Score of the macro board. It only changes when a board is decided, so
+# entries are filled in on first use rather than all 3^9 * 2^9 up front.
+# Drawn boards are counted for both players, which blocks their lines.
+@functools.lru_cache(maxsize=None)
+def macro_eval(x_macro, o_macro, drawn):
+    score = line_score(x_macro | drawn, o_macro | drawn, MACRO_THREAT, MACRO_OPEN)
+    for board_idx in range(9):
+        if o_macro >> board_idx & 1:
+            score += WON_BOARD + BOARD_WEIGHTS[board_idx]
+        elif x_macro >> board_idx & 1:
+            score -= WON_BOARD + BOARD_WEIGHTS[board_idx]
+    return score
+
+# Mask of the cells (or boards) holding the given value
+def cells_mask(cells, value):
+    mask = 0
+    for i, cell in enumerate(cells):
+        if cell == value:
+            mask |= 1 << i
+    return mask
@@ -0,0 +1,64 @@
+# Transposition table with a fixed number of slots.
+# Entries are (key, depth, score, bound, best_move, generation) tuples in a
+# preallocated list indexed by the low bits of the Zobrist key. A slot held
+# by another position is only overwritten when the new result is at least
+# as deep or the old one is left over from an earlier search.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable:
+    ENTRY_BYTES = 200  # rough size of one slot plus its entry tuple and ints
+
+    def __init__(self, size_mb=16):
+        slots = 1
+        while slots * 2 * self.ENTRY_BYTES <= size_mb * 1024 * 1024:
+            slots *= 2
+        self.mask = slots - 1
+        self.entries = [None] * slots
+        self.generation = 0
+        self.filled = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return self.filled
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, best_move):
+        slot = key & self.mask
+        old = self.entries[slot]
+        if old is None:
+            self.filled += 1
+        elif old[0] != key:
+            if old[5] == self.generation and old[1] > depth:
+                return
+            self.evictions += 1
+        self.entries[slot] = (key, depth, score, bound, best_move, self.generation)
+        self.stores += 1
+
+    def clear(self):
+        self.entries = [None] * (self.mask + 1)
+        self.filled = 0
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'slots': self.mask + 1,
+            'filled': self.filled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
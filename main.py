@@ -1,7 +1,16 @@
 import streamlit as st
-import copy
-import math
+import functools
+import logging
+import os
+import textwrap
 import time
+import uuid
+from concurrent.futures import CancelledError
+
+from engine import (
+    AIService, Ponderer, ServiceBusy, ai_move, append_game, init_game, is_valid_move, make_move, open_store,
+    stop_pondering, unmake_move,
+)
 
 # Custom CSS for better UI
 def load_css():
@@ -182,157 +191,58 @@ def load_css():
     </style>
     """, unsafe_allow_html=True)
 
-# Initialize game state
-def init_game():
-    return {
-        'board': [['' for _ in range(9)] for _ in range(9)],
-        'small_board_status': [None] * 9,
-        'next_board': None,
-        'current_player': 'X',
-        'game_over': False,
-        'winner': None,
-        'move_history': [],
-        'start_time': time.time()
-    }
-
-# Check if a player won a small board
-def check_small_board_win(board, board_idx, player):
-    cells = board[board_idx]
-    win_patterns = [
-        [0,1,2], [3,4,5], [6,7,8],
-        [0,3,6], [1,4,7], [2,5,8],
-        [0,4,8], [2,4,6]
-    ]
-    for pattern in win_patterns:
-        if all(cells[i] == player for i in pattern):
-            return True
-    return False
-
-# Check if a small board is full
-def is_small_board_full(board, board_idx):
-    return all(cell != '' for cell in board[board_idx])
-
-# Check if large board has a winner
-def check_large_board_win(status, player):
-    win_patterns = [
-        [0,1,2], [3,4,5], [6,7,8],
-        [0,3,6], [1,4,7], [2,5,8],
-        [0,4,8], [2,4,6]
-    ]
-    for pattern in win_patterns:
-        if all(status[i] == player for i in pattern):
-            return True
-    return False
-
-# Get valid moves
-# Get valid moves
-# Get valid moves
-def get_valid_moves(state):
-    moves = []
-    target = state['next_board']
-    
-    # 1. If there is a target board and it is not yet won or drawn
-    if target is not None and state['small_board_status'][target] is None:
-        for cell in range(9):
-            if state['board'][target][cell] == '':
-                moves.append((target, cell))
-    
-    # 2. If no moves are possible in the target board (it's full/won) 
-    # OR no target is set, the player can move in ANY available board.
-    if not moves:
-        for board_idx in range(9):
-            if state['small_board_status'][board_idx] is None:
-                for cell_idx in range(9):
-                    if state['board'][board_idx][cell_idx] == '':
-                        moves.append((board_idx, cell_idx))
-    return moves
-# Make a move
-# Make a move
-def make_move(state, board_idx, cell_idx, player):
-    state['board'][board_idx][cell_idx] = player
-    
-    if check_small_board_win(state['board'], board_idx, player):
-        state['small_board_status'][board_idx] = player
-    elif is_small_board_full(state['board'], board_idx):
-        state['small_board_status'][board_idx] = 'D'
-    
-    if check_large_board_win(state['small_board_status'], player):
-        state['game_over'] = True
-        state['winner'] = player
-    elif all(s is not None for s in state['small_board_status']):
-        state['game_over'] = True
-        state['winner'] = 'Draw'
-    
-    # FIX: Check if the target board (determined by cell_idx) is still available
-    if state['small_board_status'][cell_idx] is None:
-        state['next_board'] = cell_idx
-    else:
-        state['next_board'] = None
-# Evaluate board state
-def evaluate_state(state):
-    if state['winner'] == 'O':
-        return 1000
-    elif state['winner'] == 'X':
-        return -1000
-    
-    score = 0
-    for i in range(9):
-        if state['small_board_status'][i] == 'O':
-            score += 10
-        elif state['small_board_status'][i] == 'X':
-            score -= 10
-    
-    return score
+# Banner shown in place of a decided board's cells
+DECIDED_BANNERS = {
+    'X': """
+                    <div style='background: linear-gradient(135deg, #ff6b6b, #ee5a6f); 
+                                color: white; padding: 30px; border-radius: 15px; 
+                                text-align: center; font-size: 24px; font-weight: bold;
+                                box-shadow: 0 4px 15px rgba(255,107,107,0.4);'>
+                        ❌ HUMAN WINS!
+                    </div>
+                    """,
+    'O': """
+                    <div style='background: linear-gradient(135deg, #4facfe, #00f2fe); 
+                                color: white; padding: 30px; border-radius: 15px; 
+                                text-align: center; font-size: 24px; font-weight: bold;
+                                box-shadow: 0 4px 15px rgba(79,172,254,0.4);'>
+                        ⭕ AI WINS!
+                    </div>
+                    """,
+    'D': """
+                    <div style='background: linear-gradient(135deg, #a8a8a8, #c0c0c0); 
+                                color: white; padding: 30px; border-radius: 15px; 
+                                text-align: center; font-size: 24px; font-weight: bold;
+                                box-shadow: 0 4px 15px rgba(168,168,168,0.4);'>
+                        🤝 DRAW
+                    </div>
+                    """,
+}
+CELL_MARKUP = {
+    'X': "<div style='text-align: center; font-size: 32px; color: #e74c3c; font-weight: bold;'>❌</div>",
+    'O': "<div style='text-align: center; font-size: 32px; color: #3498db; font-weight: bold;'>⭕</div>",
+}
+HISTORY_PAGE_SIZE = 20
 
-# Minimax with Alpha-Beta Pruning
-def minimax(state, depth, alpha, beta, is_maximizing):
-    if state['game_over'] or depth == 0:
-        return evaluate_state(state)
-    
-    moves = get_valid_moves(state)
-    if not moves:
-        return 0
-    
-    if is_maximizing:
-        max_eval = -math.inf
-        for board_idx, cell_idx in moves:
-            new_state = copy.deepcopy(state)
-            make_move(new_state, board_idx, cell_idx, 'O')
-            eval_score = minimax(new_state, depth - 1, alpha, beta, False)
-            max_eval = max(max_eval, eval_score)
-            alpha = max(alpha, eval_score)
-            if beta <= alpha:
-                break
-        return max_eval
-    else:
-        min_eval = math.inf
-        for board_idx, cell_idx in moves:
-            new_state = copy.deepcopy(state)
-            make_move(new_state, board_idx, cell_idx, 'X')
-            eval_score = minimax(new_state, depth - 1, alpha, beta, True)
-            min_eval = min(min_eval, eval_score)
-            beta = min(beta, eval_score)
-            if beta <= alpha:
-                break
-        return min_eval
+# Outline, title and (for decided boards) banner of one small board.
+# Markup is cached on what it depends on, so a rerun only builds the
+# boards whose status or highlight changed.
+@functools.lru_cache(maxsize=None)
+def board_markup(board_idx, status, is_active):
+    outline_class = 'board-outline-active' if is_active else 'board-outline'
+    title = f"### **Board {board_idx}** 🎯" if is_active else f"### **Board {board_idx}**"
+    return f'<div class="{outline_class}"></div>\n\n{title}\n' + textwrap.dedent(DECIDED_BANNERS.get(status, ''))
 
-# AI move
-def ai_move(state, depth=3):
-    best_score = -math.inf
-    best_move = None
-    moves = get_valid_moves(state)
-    
-    for board_idx, cell_idx in moves:
-        new_state = copy.deepcopy(state)
-        make_move(new_state, board_idx, cell_idx, 'O')
-        score = minimax(new_state, depth - 1, -math.inf, math.inf, False)
-        if score > best_score:
-            best_score = score
-            best_move = (board_idx, cell_idx)
-    
-    return best_move
+# A row of three filled cells as a single block, cached on its contents
+@functools.lru_cache(maxsize=None)
+def row_markup(values):
+    cells = ''.join(CELL_MARKUP[value] for value in values)
+    return f"<div style='display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem;'>{cells}</div>"
 
 # Display board with enhanced UI
+# Each small board is one markdown block plus, for undecided boards, one
+# element per row: a single block when the row is full, otherwise
+# columns holding the cell buttons.
 def display_board(state):
     st.markdown('<div class="board-container">', unsafe_allow_html=True)
     
@@ -349,52 +259,17 @@ def display_board(state):
                     # If next_board is None, any board that isn't finished is active
                     is_active = (state['small_board_status'][board_idx] is None)
                 
-                # Apply board outline styling
-                outline_class = 'board-outline-active' if is_active else 'board-outline'
-                st.markdown(f'<div class="{outline_class}">', unsafe_allow_html=True)
-                
-                # Board header
-                board_title = f"**Board {board_idx}**"
-                if is_active:
-                    st.markdown(f"### {board_title} 🎯", unsafe_allow_html=True)
-                else:
-                    st.markdown(f"### {board_title}", unsafe_allow_html=True)
-                
-                if status == 'X':
-                    st.markdown("""
-                    <div style='background: linear-gradient(135deg, #ff6b6b, #ee5a6f); 
-                                color: white; padding: 30px; border-radius: 15px; 
-                                text-align: center; font-size: 24px; font-weight: bold;
-                                box-shadow: 0 4px 15px rgba(255,107,107,0.4);'>
-                        ❌ HUMAN WINS!
-                    </div>
-                    """, unsafe_allow_html=True)
-                elif status == 'O':
-                    st.markdown("""
-                    <div style='background: linear-gradient(135deg, #4facfe, #00f2fe); 
-                                color: white; padding: 30px; border-radius: 15px; 
-                                text-align: center; font-size: 24px; font-weight: bold;
-                                box-shadow: 0 4px 15px rgba(79,172,254,0.4);'>
-                        ⭕ AI WINS!
-                    </div>
-                    """, unsafe_allow_html=True)
-                elif status == 'D':
-                    st.markdown("""
-                    <div style='background: linear-gradient(135deg, #a8a8a8, #c0c0c0); 
-                                color: white; padding: 30px; border-radius: 15px; 
-                                text-align: center; font-size: 24px; font-weight: bold;
-                                box-shadow: 0 4px 15px rgba(168,168,168,0.4);'>
-                        🤝 DRAW
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
+                st.markdown(board_markup(board_idx, status, is_active), unsafe_allow_html=True)
+                if status is None:
                     # Create 3x3 grid for cells
                     for small_row in range(3):
+                        values = tuple(state['board'][board_idx][small_row * 3:small_row * 3 + 3])
+                        if '' not in values:
+                            st.markdown(row_markup(values), unsafe_allow_html=True)
+                            continue
                         cell_cols = st.columns(3)
-                        for small_col in range(3):
+                        for small_col, cell_value in enumerate(values):
                             cell_idx = small_row * 3 + small_col
-                            cell_value = state['board'][board_idx][cell_idx]
-                            
                             with cell_cols[small_col]:
                                 if cell_value == '':
                                     # Empty cell - clickable button with better visibility
@@ -404,38 +279,191 @@ def display_board(state):
                                                help="Click to place your move"):
                                         if not state['game_over']:
                                             handle_human_move(board_idx, cell_idx)
-                                elif cell_value == 'X':
-                                    st.markdown("<div style='text-align: center; font-size: 32px; color: #e74c3c; font-weight: bold;'>❌</div>", 
-                                              unsafe_allow_html=True)
                                 else:
-                                    st.markdown("<div style='text-align: center; font-size: 32px; color: #3498db; font-weight: bold;'>⭕</div>", 
-                                              unsafe_allow_html=True)
+                                    st.markdown(CELL_MARKUP[cell_value], unsafe_allow_html=True)
                 
-                st.markdown('</div>', unsafe_allow_html=True)  # Close board outline
                 st.markdown("<br>", unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+# One move of the history list, cached per (player, board, cell)
+@functools.lru_cache(maxsize=None)
+def move_markup(player, board, cell):
+    icon = '❌' if player == 'Human' else '⭕'
+    color = '#e74c3c' if player == 'Human' else '#3498db'
+    return textwrap.dedent(f"""
+    <div class='move-history'>
+        <span style='color: {color}; font-weight: bold;'>{icon} {player}</span>
+        <br>Board {board}, Cell {cell}
+    </div>
+    """)
+
+# Newest-first page of the move history as one markdown block, so the
+# cost of drawing it does not grow with the length of the game
+def history_page_markup(history, page):
+    end = len(history) - page * HISTORY_PAGE_SIZE
+    entries = history[max(0, end - HISTORY_PAGE_SIZE):end]
+    return ''.join(move_markup(*entry) for entry in reversed(entries))
+
+# AI thinking time per move; depth is capped by the number of empty cells
+AI_THINK_MS = 500
+MAX_SEARCH_DEPTH = 81
+# 'alphabeta' or 'mcts'
+AI_ENGINE = os.environ.get('UTTT_ENGINE', 'alphabeta')
+# Search on the human's time between moves; set UTTT_PONDER=1 to turn on.
+# Only one session ponders at a time, and any AI move stops it first.
+PONDER = os.environ.get('UTTT_PONDER', '0') == '1'
+# With UTTT_AI_WORKERS > 0, AI moves for every session are searched by a
+# shared pool of that many worker processes instead of in the session's
+# own thread (pondering then stays off). The page polls for the answer.
+AI_WORKERS = int(os.environ.get('UTTT_AI_WORKERS', '0'))
+AI_POLL_SECONDS = 0.1
+
+# With UTTT_GAMES set, finished games are appended to that file as
+# compact binary records
+GAMES_PATH = os.environ.get('UTTT_GAMES')
+
+# With UTTT_STORE set ('sqlite:PATH' or 'file:DIR'), games are saved there
+# after every move under the id in the page URL, so a reload or another
+# replica resumes them, and AI search results are shared through it.
+STORE_SPEC = os.environ.get('UTTT_STORE')
+
+# With UTTT_SEARCH_LOG set, a structured search log is written there: one
+# JSON object per AI move, for dashboards
+SEARCH_LOG_PATH = os.environ.get('UTTT_SEARCH_LOG')
+
+def setup_search_log():
+    search_logger = logging.getLogger('engine.search')
+    if SEARCH_LOG_PATH and not search_logger.handlers:
+        handler = logging.FileHandler(SEARCH_LOG_PATH)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        search_logger.addHandler(handler)
+        search_logger.setLevel(logging.INFO)
+        search_logger.propagate = False
+
+# One background ponderer per session
+def get_ponderer():
+    if 'ponderer' not in st.session_state:
+        st.session_state.ponderer = Ponderer(AI_ENGINE, max_depth=MAX_SEARCH_DEPTH)
+    return st.session_state.ponderer
+
+# One worker service for the whole server
+@st.cache_resource
+def get_ai_service():
+    return AIService(AI_WORKERS)
+
+@st.cache_resource
+def get_store():
+    return open_store(STORE_SPEC) if STORE_SPEC else None
+
+# Kept in the URL as ?game=<id> so the game survives a reload
+def get_session_id():
+    if 'session_id' not in st.session_state:
+        session_id = st.query_params.get('game', '')
+        if not session_id.isalnum():
+            session_id = uuid.uuid4().hex
+            st.query_params['game'] = session_id
+        st.session_state.session_id = session_id
+    return st.session_state.session_id
+
+def load_game():
+    store = get_store()
+    state = store.load(get_session_id()) if store is not None else None
+    return state or init_game()
+
+# Saved once the AI has replied, so a restored game is never left
+# waiting on a move that was in flight
+def save_game(state):
+    store = get_store()
+    if store is not None:
+        store.save(get_session_id(), state)
+
+def apply_ai_move(state, move, stats):
+    state['last_search'] = stats
+    make_move(state, move[0], move[1], 'O')
+    state['move_history'].append(('AI', move[0], move[1]))
+
+# Pick up a finished service job, if any. Returns True while the AI is
+# still thinking. If the job failed, the human's move is taken back so it
+# can be played again.
+def collect_ai_move(state):
+    job = st.session_state.get('ai_job')
+    if job is None:
+        return False
+    if not job.done():
+        return True
+    st.session_state.ai_job = None
+    try:
+        move, stats = job.result()
+    except CancelledError:
+        return False
+    except Exception:
+        logging.getLogger(__name__).exception("AI move failed")
+        unmake_move(state, st.session_state.ai_undo)
+        state['move_history'].pop()
+        st.error("❌ The AI could not move. Your last move was taken back, please play it again.")
+        return False
+    apply_ai_move(state, move, stats)
+    save_game(state)
+    return False
+
+def record_finished_game(state):
+    if GAMES_PATH and state['game_over'] and not state.get('recorded'):
+        moves = [(board_idx, cell_idx) for _, board_idx, cell_idx in state['move_history']]
+        append_game(GAMES_PATH, moves, state['winner'])
+        state['recorded'] = True
+        save_game(state)
+
+def new_game():
+    get_ponderer().stop()
+    if AI_WORKERS:
+        get_ai_service().cancel_session(get_session_id())
+    st.session_state.ai_job = None
+    st.session_state.game_state = init_game()
+    save_game(st.session_state.game_state)
+
 def handle_human_move(board_idx, cell_idx):
     state = st.session_state.game_state
     
-    if state['game_over']:
+    if state['game_over'] or st.session_state.get('ai_job') is not None:
         return
     
-    valid_moves = get_valid_moves(state)
-    if (board_idx, cell_idx) not in valid_moves:
+    if not is_valid_move(state, board_idx, cell_idx):
         st.error("❌ Invalid move! Please select a valid cell.")
         return
     
-    make_move(state, board_idx, cell_idx, 'X')
-    state['move_history'].append(('Human', board_idx, cell_idx))
-    
-    if not state['game_over']:
-        with st.spinner('🤖 AI is thinking...'):
-            time.sleep(0.5)  # Brief pause for better UX
-            ai_board, ai_cell = ai_move(state)
-            make_move(state, ai_board, ai_cell, 'O')
-            state['move_history'].append(('AI', ai_board, ai_cell))
+    if AI_WORKERS:
+        undo = make_move(state, board_idx, cell_idx, 'X')
+        state['move_history'].append(('Human', board_idx, cell_idx))
+        if not state['game_over']:
+            st.session_state.ai_undo = undo
+            try:
+                st.session_state.ai_job = get_ai_service().submit(
+                    get_session_id(), state, AI_THINK_MS, depth=MAX_SEARCH_DEPTH, timed=True,
+                    engine=AI_ENGINE, result_cache=get_store())
+            except ServiceBusy:
+                unmake_move(state, undo)
+                state['move_history'].pop()
+                st.error("⏳ The AI is busy with other games. Please try your move again.")
+                return
+        else:
+            save_game(state)
+    else:
+        ponderer = get_ponderer()
+        state['last_ponder'] = ponderer.stop()
+        stop_pondering()
+        make_move(state, board_idx, cell_idx, 'X')
+        state['move_history'].append(('Human', board_idx, cell_idx))
+        
+        if not state['game_over']:
+            with st.spinner('🤖 AI is thinking...'):
+                move, stats = ai_move(state, depth=MAX_SEARCH_DEPTH, time_budget_ms=AI_THINK_MS,
+                                      return_stats=True, timed=True, engine=AI_ENGINE, tree=ponderer.tree,
+                                      result_cache=get_store())
+                apply_ai_move(state, move, stats.as_dict())
+            if PONDER and not state['game_over']:
+                ponderer.start(state)
+        save_game(state)
     
     st.rerun()
 
@@ -449,6 +477,7 @@ def main():
     )
     
     load_css()
+    setup_search_log()
     
     # Title
     st.markdown("""
@@ -462,16 +491,18 @@ def main():
     
     # Initialize game state
     if 'game_state' not in st.session_state:
-        st.session_state.game_state = init_game()
+        st.session_state.game_state = load_game()
     
     state = st.session_state.game_state
+    ai_thinking = collect_ai_move(state)
+    record_finished_game(state)
     
     # Sidebar
     with st.sidebar:
         st.markdown("## 🎯 Game Control")
         
         if st.button("🔄 New Game", use_container_width=True, type="primary"):
-            st.session_state.game_state = init_game()
+            new_game()
             st.rerun()
         
         st.markdown("---")
@@ -516,6 +547,64 @@ def main():
             </div>
             """, unsafe_allow_html=True)
         
+        # Last AI search
+        search = state.get('last_search')
+        if search:
+            col5, col6 = st.columns(2)
+            with col5:
+                st.markdown(f"""
+                <div class='stat-card'>
+                    <div class='stat-number'>{search['nodes']:,}</div>
+                    <div class='stat-label'>AI Nodes</div>
+                </div>
+                """, unsafe_allow_html=True)
+            
+            with col6:
+                depth_label = ('Book' if search['book_hit'] else 'Solved' if search.get('solved')
+                               else 'Cached' if search.get('cache_hit') else search['depth'])
+                st.markdown(f"""
+                <div class='stat-card'>
+                    <div class='stat-number'>{depth_label}</div>
+                    <div class='stat-label'>AI Depth</div>
+                </div>
+                """, unsafe_allow_html=True)
+            
+            col7, col8 = st.columns(2)
+            with col7:
+                st.markdown(f"""
+                <div class='stat-card'>
+                    <div class='stat-number'>{search['nodes_per_sec'] / 1000:.0f}k</div>
+                    <div class='stat-label'>Nodes/s</div>
+                </div>
+                """, unsafe_allow_html=True)
+            
+            with col8:
+                st.markdown(f"""
+                <div class='stat-card'>
+                    <div class='stat-number'>{search['tt_hit_rate']:.0%}</div>
+                    <div class='stat-label'>Table Hits</div>
+                </div>
+                """, unsafe_allow_html=True)
+            
+            pv = ' → '.join(f"{board}/{cell}" for board, cell in search['pv'])
+            st.caption(
+                f"⏱️ {search['total_ms']:.0f} ms: move gen {search['movegen_ms']:.0f} ms, "
+                f"make/unmake {search['make_ms']:.0f} ms, eval {search['eval_ms']:.0f} ms, "
+                f"{search['cutoffs']:,} cutoffs"
+            )
+            if pv:
+                st.caption(f"🧭 Expected line (board/cell): {pv}")
+            ponder = state.get('last_ponder')
+            if ponder and ponder['nodes']:
+                st.caption(f"💭 Pondered {ponder['nodes']:,} nodes (depth {ponder['depth']}) on your time")
+        
+        if AI_WORKERS:
+            metrics = get_ai_service().metrics()
+            st.caption(
+                f"🏭 AI workers: {metrics['busy']}/{metrics['workers']} busy, {metrics['queued']} queued, "
+                f"mean wait {metrics['mean_wait_ms']:.0f} ms, {metrics['rejected']} turned away"
+            )
+        
         st.markdown("---")
         
         # Current turn indicator
@@ -538,17 +627,14 @@ def main():
         # Move history
         st.markdown("### 📝 Move History")
         if state['move_history']:
+            pages = (len(state['move_history']) - 1) // HISTORY_PAGE_SIZE + 1
+            page = 1
+            if pages > 1:
+                page = st.number_input(f"Page (1 = latest, of {pages})", min_value=1, max_value=pages,
+                                       value=1, key='history_page')
             history_container = st.container(height=300)
             with history_container:
-                for i, (player, board, cell) in enumerate(reversed(state['move_history'])):
-                    icon = '❌' if player == 'Human' else '⭕'
-                    color = '#e74c3c' if player == 'Human' else '#3498db'
-                    st.markdown(f"""
-                    <div class='move-history'>
-                        <span style='color: {color}; font-weight: bold;'>{icon} {player}</span>
-                        <br>Board {board}, Cell {cell}
-                    </div>
-                    """, unsafe_allow_html=True)
+                st.markdown(history_page_markup(state['move_history'], page - 1), unsafe_allow_html=True)
         else:
             st.info("No moves yet. Make the first move!")
         
@@ -570,6 +656,8 @@ def main():
             """)
     
     # Main game area
+    if ai_thinking:
+        st.info("🤖 AI is thinking...")
     display_board(state)
     
     # Game over display
@@ -599,6 +687,11 @@ def main():
                 </div>
             </div>
             """, unsafe_allow_html=True)
+    
+    # Check back for the AI's move
+    if ai_thinking:
+        time.sleep(AI_POLL_SECONDS)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,50 @@
+import random
+
+from engine.bitboard import BitState
+from engine.game import get_valid_moves, init_game, make_move
+from engine.tables import O
+
+# Shared by the engine tests. Positions come from seeded random games, so
+# every run sees the same ones.
+
+RESULTS = {'O': 1, 'X': -1, 'Draw': 0}
+
+# Dict state and BitState after the same random moves, with the moves
+def random_game(seed, plies=None):
+    rng = random.Random(seed)
+    state = init_game()
+    bits = BitState()
+    moves = []
+    while not state['game_over'] and (plies is None or len(moves) < plies):
+        board_idx, cell_idx = rng.choice(sorted(get_valid_moves(state)))
+        player = state['current_player']
+        make_move(state, board_idx, cell_idx, player)
+        state['move_history'].append(('Human' if player == 'X' else 'AI', board_idx, cell_idx))
+        bits.make(board_idx, cell_idx)
+        moves.append((board_idx, cell_idx))
+    return state, bits, moves
+
+# Random positions still in play with at most `cells` open cells
+def endgame_positions(count, cells):
+    positions = []
+    seed = 0
+    while len(positions) < count:
+        rng = random.Random(seed)
+        seed += 1
+        bits = BitState()
+        while not bits.game_over and bits.open_cells() > cells:
+            bits.make(*rng.choice(bits.moves()))
+        if not bits.game_over:
+            positions.append(bits)
+    return positions
+
+# Exact game result from O's point of view
+def brute_force(bits):
+    if bits.winner is not None:
+        return RESULTS[bits.winner]
+    values = []
+    for move in bits.moves():
+        bits.make(*move)
+        values.append(brute_force(bits))
+        bits.unmake()
+    return max(values) if bits.side == O else min(values)
@@ -0,0 +1,33 @@
+import pytest
+
+from engine.bitboard import BitState
+from engine.search import SearchContext, evaluate_state, search_root
+
+from .helpers import random_game
+
+# Skipped where NumPy is not installed
+pytest.importorskip('numpy')
+from engine.batch_eval import score_children
+
+def test_score_children_matches_evaluate_state():
+    for seed in range(40):
+        _, _, moves = random_game(seed)
+        bits = BitState()
+        for move in moves[:-1]:
+            bits.make(*move)
+            children = bits.moves()
+            expected = []
+            for child in children:
+                bits.make(*child)
+                expected.append(evaluate_state(bits))
+                bits.unmake()
+            assert score_children(bits, children) == expected
+
+def test_batch_search_matches_scalar_search():
+    for seed in range(10):
+        _, bits, _ = random_game(seed, plies=seed * 3)
+        if bits.game_over:
+            continue
+        scalar = search_root(bits, 3, SearchContext())
+        batched = search_root(bits, 3, SearchContext(batch_eval=score_children))
+        assert batched[1] == scalar[1]
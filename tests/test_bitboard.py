@@ -0,0 +1,54 @@
+import random
+
+from engine.bitboard import BitState
+from engine.game import get_valid_moves, init_game, is_valid_move, make_move
+
+from .helpers import random_game
+
+def assert_same_position(bits, state):
+    fresh = BitState.from_dict(state)
+    assert bits.cells == fresh.cells
+    assert bits.empty == fresh.empty
+    assert bits.macro == fresh.macro and bits.drawn == fresh.drawn
+    assert bits.next_board == fresh.next_board and bits.side == fresh.side
+    assert bits.winner == fresh.winner
+    assert bits.key == fresh.key == bits.compute_key()
+    assert bits.board_scores == fresh.board_scores
+    assert (bits.score, bits.macro_score) == (fresh.score, fresh.macro_score)
+
+# Moves, legality, key and incremental scores follow the dict rules
+def test_bitstate_matches_dict_rules():
+    for seed in range(60):
+        rng = random.Random(seed)
+        state = init_game()
+        bits = BitState()
+        while not state['game_over']:
+            valid = get_valid_moves(state)
+            assert sorted(valid) == sorted(bits.moves())
+            for board_idx in range(9):
+                for cell_idx in range(9):
+                    assert is_valid_move(state, board_idx, cell_idx) == bits.is_legal(board_idx, cell_idx)
+            board_idx, cell_idx = rng.choice(sorted(valid))
+            make_move(state, board_idx, cell_idx, state['current_player'])
+            bits.make(board_idx, cell_idx)
+            assert_same_position(bits, state)
+
+def test_make_unmake_round_trip():
+    for seed in range(100):
+        _, bits, _ = random_game(seed, plies=random.Random(seed).randrange(1, 60))
+        start = bits.copy()
+        rng = random.Random(seed + 1000)
+        made = 0
+        while not bits.game_over and made < 8:
+            bits.make(*rng.choice(sorted(bits.moves())))
+            made += 1
+        for _ in range(made):
+            bits.unmake()
+        for name in BitState.__slots__:
+            assert getattr(bits, name) == getattr(start, name), name
+
+def test_to_dict_round_trip():
+    for seed in range(30):
+        state, bits, _ = random_game(seed, plies=random.Random(seed).randrange(0, 81))
+        assert BitState.from_dict(bits.to_dict()).key == bits.key
+        assert bits.to_dict()['board'] == state['board']
@@ -0,0 +1,47 @@
+import random
+
+from engine.book import BOOK, SOLVED, Book, add_entry, load_book, write_book
+from engine.symmetry import symmetric_key, transform_move, transform_state
+
+from .helpers import random_game
+
+# Positions no symmetry other than the identity maps onto themselves, so
+# each image has exactly one matching move
+def asymmetric_positions(count):
+    positions = []
+    seed = 0
+    while len(positions) < count:
+        _, bits, _ = random_game(seed, plies=random.Random(seed).randrange(3, 40))
+        seed += 1
+        if not bits.game_over and all(symmetric_key(bits, sym) != bits.key for sym in range(1, 8)):
+            positions.append(bits)
+    return positions
+
+def test_write_book_lookup_round_trip_under_symmetry(tmp_path):
+    path = str(tmp_path / 'book.bin')
+    positions = asymmetric_positions(20)
+    entries = {}
+    expected = []
+    for i, bits in enumerate(positions):
+        move = sorted(bits.moves())[i % len(bits.moves())]
+        kind = BOOK if i % 2 else SOLVED
+        add_entry(entries, bits, move, kind, i - 10, i % 7)
+        expected.append((bits, move, kind, i - 10, i % 7))
+    write_book(path, entries)
+
+    book = Book(path)
+    try:
+        for bits, move, kind, score, depth in expected:
+            for sym in range(8):
+                image = transform_state(bits, sym)
+                assert book.lookup(image) == (transform_move(move, sym), kind, score, depth)
+        _, unknown, _ = random_game(1000, plies=1)
+        assert book.lookup(unknown) is None
+    finally:
+        book.close()
+
+def test_load_book_skips_missing_and_old_files(tmp_path):
+    assert load_book(str(tmp_path / 'missing.bin')) is None
+    path = tmp_path / 'old.bin'
+    path.write_bytes(b'UTTB\x01\x00' + bytes(10))
+    assert load_book(str(path)) is None
@@ -0,0 +1,33 @@
+import time
+
+from engine.endgame import solve_root
+from engine.search import SearchContext, run_solver
+from engine.tables import O
+from engine.transposition import TranspositionTable
+
+from .helpers import brute_force, endgame_positions
+
+def test_solver_matches_brute_force():
+    shared = TranspositionTable(1)
+    for bits in endgame_positions(40, 8):
+        expected = brute_force(bits)
+        for cache in (TranspositionTable(1), shared):
+            move, result, _ = solve_root(bits, cache=cache)
+            assert result == expected
+            bits.make(*move)
+            assert brute_force(bits) == expected
+            bits.unmake()
+
+# A lost position is left to the search, which plays on for a swindle
+def test_run_solver_leaves_lost_positions_to_search():
+    lost = held = 0
+    for bits in endgame_positions(40, 8):
+        result = brute_force(bits)
+        solved = run_solver(bits, SearchContext(), time.perf_counter())
+        if result == (-1 if bits.side == O else 1):
+            lost += 1
+            assert solved is None
+        else:
+            held += 1
+            assert solved is not None
+    assert lost and held
@@ -0,0 +1,30 @@
+import copy
+import random
+
+from engine.game import make_move, unmake_move
+
+from .helpers import random_game
+
+def test_make_unmake_move_round_trip():
+    for seed in range(100):
+        state, bits, _ = random_game(seed, plies=random.Random(seed).randrange(1, 60))
+        start = copy.deepcopy(state)
+        rng = random.Random(seed + 1000)
+        undos = []
+        while not bits.game_over and len(undos) < 8:
+            board_idx, cell_idx = rng.choice(sorted(bits.moves()))
+            bits.make(board_idx, cell_idx)
+            undos.append(make_move(state, board_idx, cell_idx, state['current_player']))
+        for undo in reversed(undos):
+            unmake_move(state, undo)
+        assert state == start
+
+def test_unmake_move_reopens_finished_game():
+    state, _, moves = random_game(7)
+    assert state['game_over']
+    last = moves[-1]
+    replayed, _, _ = random_game(7, plies=len(moves) - 1)
+    undo = make_move(replayed, *last, replayed['current_player'])
+    assert replayed['game_over']
+    unmake_move(replayed, undo)
+    assert not replayed['game_over'] and replayed['winner'] is None
@@ -0,0 +1,26 @@
+import random
+
+import pytest
+
+from engine.parallel import shutdown_search_pool
+from engine.search import ai_move
+
+from .helpers import random_game
+
+@pytest.fixture(autouse=True)
+def search_pool():
+    yield
+    shutdown_search_pool()
+
+# Without a table, root-parallel search picks the serial search's move
+def test_parallel_matches_serial_search():
+    for seed in range(6):
+        state, bits, _ = random_game(seed, plies=random.Random(seed).randrange(0, 30))
+        if bits.game_over:
+            continue
+        options = {'depth': 3, 'tt': None, 'book': None, 'solve_endgame': False, 'return_stats': True}
+        serial_move, serial = ai_move(state, **options)
+        parallel_move, parallel = ai_move(state, parallel=True, **options)
+        assert parallel_move == serial_move
+        assert parallel.score == serial.score
+        assert parallel.pv[0] == parallel_move
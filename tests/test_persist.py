@@ -0,0 +1,93 @@
+import pickle
+import random
+
+import pytest
+
+from engine.persist import FileStore, SQLiteStore, deserialize_state, open_store, serialize_state
+from engine.symmetry import canonical_key, transform_state
+
+from .helpers import random_game
+
+@pytest.fixture(params=['file', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'file':
+        return FileStore(str(tmp_path / 'store'))
+    return SQLiteStore(str(tmp_path / 'store.db'))
+
+def played(seed):
+    state, bits, moves = random_game(seed, plies=random.Random(seed).randrange(1, 81))
+    state['start_time'] = 1700000000 + seed
+    return state, bits, moves
+
+def test_serialize_round_trip():
+    for seed in range(50):
+        state, _, _ = played(seed)
+        if seed % 3 == 0:
+            state['recorded'] = True
+        assert deserialize_state(serialize_state(state)) == state
+
+def test_save_load_delete(store):
+    state, _, _ = played(1)
+    assert store.load('abc') is None
+    store.save('abc', state)
+    assert store.load('abc') == state
+    store.delete('abc')
+    assert store.load('abc') is None
+
+def test_deeper_and_solved_results_win(store):
+    _, bits, _ = played(2)
+    first, second = sorted(bits.moves())[:2]
+    store.store(bits, first, 10, 4)
+    store.store(bits, second, 20, 3)
+    assert store.lookup(bits) == (first, 10, 4, False)
+    store.store(bits, second, 20, 4)
+    assert store.lookup(bits) == (second, 20, 4, False)
+    store.store(bits, first, 1, 0, solved=True)
+    assert store.lookup(bits) == (first, 1, 0, True)
+    store.store(bits, second, 30, 9)
+    assert store.lookup(bits) == (first, 1, 0, True)
+    store.store(bits, second, -1, 0, solved=True)
+    assert store.lookup(bits) == (second, -1, 0, True)
+
+def test_engines_are_kept_apart(store):
+    _, bits, _ = played(3)
+    first, second = sorted(bits.moves())[:2]
+    store.store(bits, first, 5, 2)
+    store.store(bits, second, 7, 2, engine='mcts')
+    assert store.lookup(bits) == (first, 5, 2, False)
+    assert store.lookup(bits, engine='mcts') == (second, 7, 2, False)
+
+# A result stored for one image is an equivalent move in every image
+def test_lookup_under_symmetry(store):
+    for seed in range(10):
+        _, bits, _ = played(seed)
+        if bits.game_over:
+            continue
+        move = sorted(bits.moves())[seed % len(bits.moves())]
+        store.store(bits, move, seed, 3)
+        bits.make(*move)
+        expected = canonical_key(bits)[0]
+        bits.unmake()
+        for sym in range(8):
+            image = transform_state(bits, sym)
+            image_move, score, depth, solved = store.lookup(image)
+            image.make(*image_move)
+            assert canonical_key(image)[0] == expected
+            assert (score, depth, solved) == (seed, 3, False)
+
+def test_prune_keeps_the_limit(store):
+    for seed in range(12):
+        state, bits, moves = played(seed)
+        store.save(f'game{seed}', state)
+        store.store(bits, moves[-1], 0, 1)
+    store.prune('games', 5)
+    assert sum(store.load(f'game{seed}') is not None for seed in range(12)) == 5
+    store.prune('results', 3)
+    assert sum(store.lookup(played(seed)[1]) is not None for seed in range(12)) <= 3
+
+def test_sqlite_store_pickles(tmp_path):
+    store = open_store(f"sqlite:{tmp_path / 'store.db'}")
+    state, _, _ = played(4)
+    store.save('abc', state)
+    copy = pickle.loads(pickle.dumps(store))
+    assert copy.load('abc') == state
@@ -0,0 +1,51 @@
+import random
+
+from engine.records import (
+    GameIndex, append_game, build_index, decode_game, encode_game, position_keys, read_games, replay,
+)
+
+from .helpers import random_game
+
+# Everything but the clock
+def position(state):
+    return {name: value for name, value in state.items() if name != 'start_time'}
+
+def test_encode_decode_round_trip():
+    for seed in range(20):
+        state, _, moves = random_game(seed, plies=random.Random(seed).randrange(0, 81))
+        data = encode_game(moves, state['winner'])
+        assert decode_game(data) == (moves, state['winner'], len(data))
+
+def test_replay_matches_played_game():
+    for seed in range(20):
+        state, _, moves = random_game(seed)
+        assert position(replay(moves)) == position(state)
+        plies = len(moves) // 2
+        assert position(replay(moves, plies)) == position(random_game(seed, plies=plies)[0])
+
+def test_index_lookup_round_trip(tmp_path):
+    games_path = str(tmp_path / 'games.bin')
+    games = {}
+    for seed in range(30):
+        state, _, moves = random_game(seed)
+        games[append_game(games_path, moves, state['winner'])] = (moves, state)
+    assert [(offset, moves) for offset, moves, _ in read_games(games_path)] == [
+        (offset, moves) for offset, (moves, _) in games.items()
+    ]
+
+    reaching = {}
+    for offset, (moves, _) in games.items():
+        for key in position_keys(moves):
+            reaching.setdefault(key, set()).add(offset)
+    assert build_index(games_path) == sum(len(offsets) for offsets in reaching.values())
+
+    index = GameIndex(games_path + '.idx')
+    try:
+        for key, offsets in reaching.items():
+            assert index.lookup(key) == sorted(offsets)
+        for offset, (moves, state) in games.items():
+            assert offset in index.games_reaching(state)
+            assert offset in index.games_reaching(replay(moves, len(moves) // 2))
+        assert index.lookup(0) == []
+    finally:
+        index.close()
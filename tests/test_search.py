@@ -0,0 +1,65 @@
+import math
+import random
+
+from engine.search import (
+    HeuristicOrderer, SearchContext, ai_move, aspiration_search, evaluate_state, search_root,
+)
+from engine.tables import O
+from engine.transposition import TranspositionTable
+
+from .helpers import random_game
+
+# Alpha-beta with none of the search's extras: no table, no ordering, no
+# null windows
+def plain_alphabeta(bits, depth, alpha=-math.inf, beta=math.inf):
+    if bits.game_over or depth == 0:
+        return evaluate_state(bits)
+    maximizing = bits.side == O
+    best = -math.inf if maximizing else math.inf
+    for move in bits.moves():
+        bits.make(*move)
+        score = plain_alphabeta(bits, depth - 1, alpha, beta)
+        bits.unmake()
+        if maximizing:
+            best = max(best, score)
+            alpha = max(alpha, score)
+        else:
+            best = min(best, score)
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best
+
+def positions(count):
+    for seed in range(count):
+        bits = random_game(seed, plies=random.Random(seed).randrange(4, 40))[1]
+        if not bits.game_over:
+            yield bits
+
+def test_pvs_matches_plain_alphabeta():
+    for bits in positions(15):
+        for depth in (1, 2, 3):
+            expected = plain_alphabeta(bits, depth)
+            assert search_root(bits, depth, SearchContext())[1] == expected
+            ctx = SearchContext(TranspositionTable(1), orderer=HeuristicOrderer())
+            assert search_root(bits, depth, ctx)[1] == expected
+
+def test_aspiration_windows_widen_to_the_true_score():
+    researched = 0
+    for bits in positions(15):
+        expected = plain_alphabeta(bits, 3)
+        for guess in (expected, expected - 1000, expected + 1000):
+            ctx = SearchContext()
+            assert aspiration_search(bits, 3, ctx, guess)[1] == expected
+            researched += ctx.aspiration_researches
+    assert researched > 0
+
+# The iteration cut off by the deadline leaves the last finished one's PV
+def test_timed_search_reports_its_move_as_pv():
+    for seed in range(5):
+        state, bits, _ = random_game(seed, plies=random.Random(seed).randrange(4, 30))
+        if bits.game_over:
+            continue
+        move, stats = ai_move(state, depth=64, tt=TranspositionTable(1), time_budget_ms=50, book=None,
+                              solve_endgame=False, return_stats=True)
+        assert stats.pv and stats.pv[0] == move
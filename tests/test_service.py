@@ -0,0 +1,124 @@
+import time
+from concurrent.futures import CancelledError, Future
+
+import pytest
+
+from engine.game import init_game
+from engine.service import AIService, ServiceBusy
+
+# Stands in for the process pool: jobs start when dispatched and finish
+# when the test says so
+class FakePool:
+    def __init__(self):
+        self.started = []
+
+    def submit(self, fn, state, time_budget_ms, options):
+        future = Future()
+        self.started.append((options['tag'], future))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+    def wait_for(self, count):
+        deadline = time.perf_counter() + 5
+        while len(self.started) < count and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        assert len(self.started) == count
+        return [tag for tag, _ in self.started]
+
+    def finish(self, tag):
+        future = next(future for started_tag, future in self.started if started_tag == tag)
+        future.set_result(((4, 4), {'tag': tag}))
+
+def make_service(workers, max_pending=64):
+    service = AIService(workers, max_pending)
+    service.pool.shutdown()
+    service.pool = FakePool()
+    return service
+
+@pytest.fixture
+def state():
+    return init_game()
+
+def test_one_job_per_session_in_flight(state):
+    service = make_service(workers=2)
+    pool = service.pool
+    try:
+        with service.condition:
+            service.submit('a', state, 100, tag='a1')
+            service.submit('a', state, 100, tag='a2')
+        assert pool.wait_for(1) == ['a1']
+        # The second worker stays free rather than take a2 while a1 runs
+        time.sleep(0.02)
+        assert len(pool.started) == 1
+        service.submit('b', state, 100, tag='b1')
+        assert pool.wait_for(2) == ['a1', 'b1']
+        pool.finish('a1')
+        assert pool.wait_for(3)[2] == 'a2'
+    finally:
+        service.shutdown()
+
+def test_sessions_take_turns(state):
+    service = make_service(workers=1)
+    pool = service.pool
+    try:
+        with service.condition:
+            for tag in ('a1', 'a2', 'a3'):
+                service.submit('a', state, 100, tag=tag)
+            for tag in ('b1', 'b2'):
+                service.submit('b', state, 100, tag=tag)
+        order = ['a1', 'b1', 'a2', 'b2', 'a3']
+        for count, tag in enumerate(order, 1):
+            assert pool.wait_for(count)[-1] == tag
+            pool.finish(tag)
+        assert service.metrics()['completed'] == 5
+    finally:
+        service.shutdown()
+
+def test_cancel_session_drops_queued_and_running_jobs(state):
+    service = make_service(workers=1)
+    pool = service.pool
+    try:
+        running = service.submit('a', state, 100, tag='a1')
+        pool.wait_for(1)
+        queued = service.submit('a', state, 100, tag='a2')
+        other = service.submit('b', state, 100, tag='b1')
+        service.cancel_session('a')
+        assert queued.future.cancelled()
+        with pytest.raises(CancelledError):
+            running.result(timeout=1)
+
+        # The late result of the cancelled job is thrown away
+        pool.finish('a1')
+        assert pool.wait_for(2)[1] == 'b1'
+        pool.finish('b1')
+        assert other.result(timeout=1) == ((4, 4), {'tag': 'b1'})
+        assert service.metrics()['cancelled'] == 2
+    finally:
+        service.shutdown()
+
+def test_full_queue_rejects_new_jobs(state):
+    service = make_service(workers=1, max_pending=2)
+    try:
+        with service.condition:
+            service.submit('a', state, 100, tag='a1')
+            service.submit('b', state, 100, tag='b1')
+            with pytest.raises(ServiceBusy):
+                service.submit('c', state, 100, tag='c1')
+        assert service.metrics()['rejected'] == 1
+    finally:
+        service.shutdown()
+
+def test_failed_job_reports_its_error(state):
+    service = make_service(workers=1)
+    pool = service.pool
+    try:
+        job = service.submit('a', state, 100, tag='a1')
+        pool.wait_for(1)
+        pool.started[0][1].set_exception(RuntimeError('worker died'))
+        with pytest.raises(RuntimeError):
+            job.result(timeout=1)
+        assert service.metrics()['failed'] == 1
+    finally:
+        service.shutdown()
@@ -0,0 +1,35 @@
+import random
+
+from engine.search import evaluate_state
+from engine.symmetry import INVERSE, canonical_key, symmetric_key, transform_move, transform_state
+
+from .helpers import random_game
+
+def positions():
+    for seed in range(40):
+        yield random_game(seed, plies=random.Random(seed).randrange(0, 60))[1]
+
+def test_symmetric_key_matches_transformed_state():
+    for bits in positions():
+        for sym in range(8):
+            assert symmetric_key(bits, sym) == transform_state(bits, sym).key
+
+def test_moves_map_under_every_symmetry():
+    for bits in positions():
+        moves = bits.moves()
+        for sym in range(8):
+            image = transform_state(bits, sym)
+            assert sorted(image.moves()) == sorted(transform_move(move, sym) for move in moves)
+            for move in moves:
+                assert transform_move(transform_move(move, sym), INVERSE[sym]) == move
+
+def test_images_are_equivalent():
+    for bits in positions():
+        key, sym = canonical_key(bits)
+        assert symmetric_key(bits, sym) == key
+        for image_sym in range(8):
+            image = transform_state(bits, image_sym)
+            assert image.winner == bits.winner
+            assert evaluate_state(image) == evaluate_state(bits)
+            assert canonical_key(image)[0] == key
+            assert transform_state(image, INVERSE[image_sym]).key == bits.key
@@ -0,0 +1,47 @@
+from engine.transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# Two keys that share a slot of `tt`
+def colliding_keys(tt):
+    return 0x1234, 0x1234 + (tt.mask + 1)
+
+def test_probe_returns_stored_entry():
+    tt = TranspositionTable(1)
+    key, other = colliding_keys(tt)
+    assert tt.probe(key) is None
+    tt.store(key, 3, 17, EXACT, (4, 4))
+    assert tt.probe(key) == (key, 3, 17, EXACT, (4, 4), tt.generation)
+    assert tt.probe(other) is None
+    assert (tt.hits, tt.misses) == (1, 2)
+    assert len(tt) == 1
+
+def test_same_position_is_always_overwritten():
+    tt = TranspositionTable(1)
+    key, _ = colliding_keys(tt)
+    tt.store(key, 9, 5, LOWER, (0, 0))
+    tt.store(key, 2, -5, UPPER, (1, 1))
+    assert tt.probe(key)[1:5] == (2, -5, UPPER, (1, 1))
+    assert tt.evictions == 0
+
+def test_shallower_entry_keeps_out_of_deeper_one_in_same_search():
+    tt = TranspositionTable(1)
+    key, other = colliding_keys(tt)
+    tt.store(key, 9, 5, EXACT, (0, 0))
+    tt.store(other, 3, 1, EXACT, (1, 1))
+    assert tt.probe(key) is not None and tt.probe(other) is None
+    assert tt.evictions == 0
+
+    # As deep or deeper replaces it
+    tt.store(other, 9, 1, EXACT, (1, 1))
+    assert tt.probe(other) is not None and tt.probe(key) is None
+    assert tt.evictions == 1
+
+def test_entries_from_earlier_searches_are_replaced():
+    tt = TranspositionTable(1)
+    key, other = colliding_keys(tt)
+    tt.store(key, 9, 5, EXACT, (0, 0))
+    tt.new_search()
+    tt.store(other, 1, 1, EXACT, (1, 1))
+    assert tt.probe(other)[5] == tt.generation
+    assert tt.probe(key) is None
+    assert tt.evictions == 1
+    assert len(tt) == 1